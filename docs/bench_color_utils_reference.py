@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+STREAMS OF COLOR - color_utils Micro-benchmarks
+================================================
+Timing baselines for the per-image / per-label helpers in color_utils, each
+as the scalar reference (called once per item, as ingestion and the label
+tools do) and its batched variant. The color-name classifiers also have a
+":lut" case: the precomputed lookup tables, classifying hex strings.
+
+- Parity first: every batched variant must return exactly the scalar
+  outputs, on random inputs plus the classification thresholds' edge
+  values, and nothing for an empty batch. Any mismatch fails the run
+  (exit code 1).
+- Then a sweep over batch size (and region size for _dominant_color),
+  timed with timeit (auto-ranged, best of --repeat), reported as ns/item.
+
+Standalone (no pytest plugin needed); results go to JSON, and --compare
+shows the change against an earlier run, asv-style.
+
+Usage:
+    python bench_color_utils.py
+    python bench_color_utils.py --only classify_eye_color classify_hair_color --output after.json --compare before.json
+    python bench_color_utils.py --quick
+"""
+
+import sys
+import json
+import timeit
+import argparse
+import itertools
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from color_utils import (
+    rgb_to_hex, hex_to_rgb, calculate_luminance, calculate_warmth,
+    classify_eye_color, classify_hair_color, ColorExtractor, SubtypePredictor, CompiledPredictor,
+    batch_rgb_to_hex, batch_hex_to_rgb, batch_luminance, batch_warmth,
+    batch_classify_eye_color, batch_classify_hair_color, DominantColorEstimator,
+    classify_eye_colors, classify_hair_colors
+)
+
+# Channel values on either side of every threshold in the classifiers
+EDGE_VALUES = [0, 1, 29, 30, 31, 99, 100, 101, 149, 150, 151, 254, 255]
+
+
+# =============================================================================
+# CASES
+# =============================================================================
+
+@dataclass
+class Case:
+    """A scalar function, its batched variant, and how to build n inputs."""
+    name: str
+    make: Callable          # (n, size, rng) -> inputs
+    scalar: Callable        # inputs -> list of outputs, one call per item
+    batch: Callable         # inputs -> list of outputs, one vectorized call
+    image: bool = False     # inputs are n regions of size x size pixels
+
+
+def _rgb_inputs(n: int, size: int, rng) -> Dict:
+    rgb = rng.integers(0, 256, (n, 3))
+    return {"rgb": rgb, "tuples": [tuple(t) for t in rgb.tolist()], "hex": [rgb_to_hex(t) for t in rgb.tolist()]}
+
+
+def _label_inputs(n: int, size: int, rng) -> Dict:
+    undertones = CompiledPredictor.UNDERTONES
+    return {
+        "undertone": rng.choice(undertones, n),
+        "depth": rng.choice(SubtypePredictor.DEPTH_ORDER, n),
+        "contrast": rng.choice(SubtypePredictor.CONTRAST_ORDER, n),
+        # analyze_batch feeds 3-place rounded confidences
+        "confidence": np.round(rng.random(n), 3),
+    }
+
+
+def _region_inputs(n: int, size: int, rng) -> Dict:
+    return {"regions": rng.integers(0, 256, (n, size, size, 3), dtype=np.uint8)}
+
+
+_extractor = ColorExtractor(use_mediapipe=False)
+_predictor = SubtypePredictor()
+_mean = DominantColorEstimator("mean")
+
+CASES = [
+    Case("rgb_to_hex", _rgb_inputs,
+         lambda x: [rgb_to_hex(t) for t in x["tuples"]],
+         lambda x: batch_rgb_to_hex(x["rgb"]).tolist()),
+    Case("hex_to_rgb", _rgb_inputs,
+         lambda x: [hex_to_rgb(h) for h in x["hex"]],
+         lambda x: [tuple(t) for t in batch_hex_to_rgb(x["hex"]).tolist()]),
+    Case("calculate_luminance", _rgb_inputs,
+         lambda x: [calculate_luminance(t) for t in x["tuples"]],
+         lambda x: batch_luminance(x["rgb"]).tolist()),
+    Case("calculate_warmth", _rgb_inputs,
+         lambda x: [calculate_warmth(t) for t in x["tuples"]],
+         lambda x: batch_warmth(x["rgb"]).tolist()),
+    Case("classify_eye_color", _rgb_inputs,
+         lambda x: [classify_eye_color(h) for h in x["hex"]],
+         lambda x: batch_classify_eye_color(x["rgb"]).tolist()),
+    Case("classify_hair_color", _rgb_inputs,
+         lambda x: [classify_hair_color(h) for h in x["hex"]],
+         lambda x: batch_classify_hair_color(x["rgb"]).tolist()),
+    Case("classify_eye_color:lut", _rgb_inputs,
+         lambda x: [classify_eye_color(h) for h in x["hex"]],
+         lambda x: classify_eye_colors(x["hex"]).tolist()),
+    Case("classify_hair_color:lut", _rgb_inputs,
+         lambda x: [classify_hair_color(h) for h in x["hex"]],
+         lambda x: classify_hair_colors(x["hex"]).tolist()),
+    Case("_dominant_color", _region_inputs,
+         lambda x: [_extractor._dominant_color(region) for region in x["regions"]],
+         lambda x: [tuple(t) for t in _mean.batch(x["regions"]).tolist()],
+         image=True),
+    Case("SubtypePredictor.predict", _label_inputs,
+         lambda x: [
+             _predictor.predict(u, d, c, conf)
+             for u, d, c, conf in zip(x["undertone"], x["depth"], x["contrast"], x["confidence"].tolist())
+         ],
+         lambda x: _predictor.predict_batch(x["undertone"], x["depth"], x["contrast"], x["confidence"])),
+]
+
+
+# =============================================================================
+# PARITY
+# =============================================================================
+
+def parity_inputs(case: Case, rng) -> Dict:
+    """Random inputs plus every edge case the scalar code branches on."""
+    if case.image:
+        inputs = _region_inputs(16, 64, rng)
+        flat = np.zeros((4, 64, 64, 3), dtype=np.uint8)
+        flat[1], flat[2], flat[3] = 255, 1, [255, 0, 128]
+        return {"regions": np.concatenate([inputs["regions"], flat])}
+
+    if case.make is _label_inputs:
+        grid = list(itertools.product(
+            CompiledPredictor.UNDERTONES, SubtypePredictor.DEPTH_ORDER, SubtypePredictor.CONTRAST_ORDER,
+            [0.0, 0.333, 0.5, 1.0]
+        ))
+        return {
+            "undertone": np.array([g[0] for g in grid]),
+            "depth": np.array([g[1] for g in grid]),
+            "contrast": np.array([g[2] for g in grid]),
+            "confidence": np.array([g[3] for g in grid]),
+        }
+
+    edges = np.array(list(itertools.product(EDGE_VALUES, repeat=3)))
+    rgb = np.concatenate([edges, rng.integers(0, 256, (20000, 3))])
+    return {"rgb": rgb, "tuples": [tuple(t) for t in rgb.tolist()], "hex": [rgb_to_hex(t) for t in rgb.tolist()]}
+
+
+def check_parity(case: Case, rng) -> Optional[str]:
+    """None if the batched variant matches the scalar outputs exactly, else the first mismatch."""
+    try:
+        empty = case.batch(case.make(0, 64, rng))
+    except Exception as e:
+        return f"empty batch: {type(e).__name__}: {e}"
+    if len(empty):
+        return f"empty batch: {len(empty)} outputs"
+    inputs = parity_inputs(case, rng)
+    expected, actual = case.scalar(inputs), case.batch(inputs)
+    if len(expected) != len(actual):
+        return f"{len(actual)} outputs, expected {len(expected)}"
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        if e != a:
+            return f"item {i}: batch {a!r} != scalar {e!r}"
+    return None
+
+
+# =============================================================================
+# TIMING
+# =============================================================================
+
+def time_per_call(fn: Callable, repeat: int) -> float:
+    """Best-of-`repeat` seconds per call, each repeat auto-ranged to >= 0.2 s."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def sweep(case: Case, batch_sizes: List[int], image_sizes: List[int], repeat: int, rng) -> List[Dict]:
+    rows = []
+    for size in (image_sizes if case.image else [None]):
+        for n in batch_sizes:
+            if case.image and n * size * size * 3 > 2 ** 30:
+                continue  # > 1 GB of pixels
+            inputs = case.make(n, size, rng)
+            scalar = time_per_call(lambda: case.scalar(inputs), repeat)
+            batch = time_per_call(lambda: case.batch(inputs), repeat)
+            rows.append({
+                "case": case.name,
+                "n": n,
+                "size": size,
+                "scalar_ns_per_item": round(scalar / n * 1e9, 1),
+                "batch_ns_per_item": round(batch / n * 1e9, 1),
+                "speedup": round(scalar / batch, 2),
+            })
+    return rows
+
+
+def compare(rows: List[Dict], baseline: Dict) -> None:
+    old = {(r["case"], r["n"], r["size"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline['timestamp']} (ns/item, scalar | batch):")
+    for r in rows:
+        b = old.get((r["case"], r["n"], r["size"]))
+        if b is None:
+            continue
+        size = f"{r['size']}px" if r["size"] else ""
+        print(f"  {r['case']:<26} n={r['n']:<6} {size:<7}"
+              f"{r['scalar_ns_per_item'] / b['scalar_ns_per_item'] - 1:+7.1%} | "
+              f"{r['batch_ns_per_item'] / b['batch_ns_per_item'] - 1:+7.1%}")
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for color_utils, scalar vs batched")
+    parser.add_argument("--only", nargs="+", metavar="CASE", help=f"Subset of: {', '.join(c.name for c in CASES)}")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--image-batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--image-sizes", type=int, nargs="+", default=[64, 256, 1024],
+                        help="Region side for _dominant_color")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="Fewer sizes, repeat 2")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_color_utils.json")
+    parser.add_argument("--compare", metavar="JSON", help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.batch_sizes, args.image_batch_sizes, args.image_sizes, args.repeat = [1, 1000], [1, 8], [64, 256], 2
+    cases = [c for c in CASES if not args.only or c.name in args.only]
+    rng = np.random.default_rng(args.seed)
+
+    failures = {}
+    for case in cases:
+        mismatch = check_parity(case, rng)
+        print(f"parity {case.name:<26} {'ok' if mismatch is None else 'FAIL: ' + mismatch}")
+        if mismatch is not None:
+            failures[case.name] = mismatch
+    if failures:
+        sys.exit(1)
+
+    rows = []
+    print(f"\n{'case':<26} {'n':>6} {'size':>6} {'scalar ns':>12} {'batch ns':>12} {'speedup':>8}")
+    for case in cases:
+        sizes = args.image_batch_sizes if case.image else args.batch_sizes
+        for row in sweep(case, sizes, args.image_sizes, args.repeat, rng):
+            rows.append(row)
+            print(f"{row['case']:<26} {row['n']:>6} {row['size'] or '':>6} {row['scalar_ns_per_item']:>12,.0f} "
+                  f"{row['batch_ns_per_item']:>12,.0f} {row['speedup']:>7.1f}x")
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "numpy": np.__version__,
+        "python": sys.version.split()[0],
+        "results": rows,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(rows, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+STREAMS OF COLOR - Ingestion Benchmark
+=======================================
+Drives Ingestion.run end to end (decode -> encode -> upload -> batch insert
+-> auto-label) against an in-process fake Database. Storage uploads and
+table writes sleep for a configurable latency instead of hitting Supabase.
+Input is synthetic face JPEGs at 256 / 512 / 1024 px.
+
+Each configuration runs in a fresh process, so peak RSS is its own. The
+report has images/s, p50/p99 latency per stage, peak RSS and, from a
+separate traced pass, Python allocations per image. Results are saved as
+JSON; --compare prints the change against an earlier report.
+
+Usage:
+    python bench_ingest.py                                   # 256/512/1024, serial
+    python bench_ingest.py --pipelined --upload-latency 0.05 --images 500
+    python bench_ingest.py --output after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import resource
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+import numpy as np
+import PIL
+
+from ingest import Config, Database, DatasetSource, Ingestion, INGEST_STAGES
+from bench_resolution import synthetic_jpegs
+
+STAGES = INGEST_STAGES
+
+
+# =============================================================================
+# FAKES
+# =============================================================================
+
+class FakeDatabase(Database):
+    """Database with storage and table writes replaced by sleeps; encoding stays real."""
+
+    def __init__(self, config: Config, upload_latency: float = 0.0, db_latency: float = 0.0):
+        super().__init__(config, client=object())
+        self.upload_latency = upload_latency
+        self.db_latency = db_latency
+        self.uploaded_bytes = 0
+        self.rows = 0
+
+    def upload_bytes(self, data: bytes, filename: str, folder: str = "celeba-hq") -> str:
+        time.sleep(self.upload_latency)
+        self.uploaded_bytes += len(data)
+        return f"{folder}/{filename}"
+
+    def upsert_face_images(self, images: List[Dict]) -> List[Dict]:
+        time.sleep(self.db_latency)
+        self.rows += len(images)
+        return [{"id": str(uuid.uuid4()), "source_id": image["source_id"]} for image in images]
+
+    def upsert_labels(self, records: List[Dict], ignore_duplicates: bool = False) -> List[Dict]:
+        time.sleep(self.db_latency)
+        return records
+
+
+class SyntheticSource(DatasetSource):
+    """Encoded synthetic faces, cycling over `variants` distinct JPEGs (generated up front)."""
+
+    def __init__(self, size: int, variants: int = 16):
+        self.name = f"synthetic:{size}"
+        self.source_type = "training_upload"
+        self.folder = f"bench-{size}"
+        self.jpegs = synthetic_jpegs(variants, size)
+
+    def iter_from(self, start: int = 0, step: int = 1) -> Iterator[Dict]:
+        offset = start
+        while True:
+            yield {"image": {"bytes": self.jpegs[offset % len(self.jpegs)], "path": None}}
+            offset += step
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+class StageTimer:
+    """Wraps an Ingestion's stage methods on the instance and records each call's duration."""
+
+    def __init__(self, ingestion: Ingestion, stages: List[str] = STAGES):
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in stages}
+        for stage in stages:
+            setattr(ingestion, stage, self._timed(stage, getattr(ingestion, stage)))
+
+    def _timed(self, stage: str, fn):
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)  # list.append is atomic
+        return timed
+
+    def summary(self) -> Dict:
+        return {
+            stage.strip("_"): {
+                "calls": len(ms),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            }
+            for stage, ms in ((s, np.array(v) * 1000) for s, v in self.samples.items()) if len(ms)
+        }
+
+
+def _make_config(args: Dict, images: int) -> Config:
+    return Config(
+        supabase_url="", supabase_key="",
+        batch_size=args["batch_size"],
+        max_images=images,
+        pipelined=args["pipelined"],
+        encode_workers=args["encode_workers"],
+        upload_workers=args["upload_workers"],
+        landmarks=False,
+        analysis_size=args["analysis_size"]
+    )
+
+
+def bench_size(size: int, args: Dict) -> Dict:
+    """One configuration, run in its own process."""
+    os.environ["TQDM_DISABLE"] = "1"
+    source = SyntheticSource(size)
+
+    def ingestion(images: int) -> Ingestion:
+        config = _make_config(args, images)
+        return Ingestion(FakeDatabase(config, args["upload_latency"], args["db_latency"]), config, source)
+
+    # Warm-up: imports, first-call allocations, thread pools
+    ingestion(args["batch_size"]).run(auto_label=args["auto_label"])
+
+    timed = ingestion(args["images"])
+    timer = StageTimer(timed)
+    start = time.perf_counter()
+    processed = timed.run(auto_label=args["auto_label"])
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+    # Allocations: a shorter, separate pass, since tracing slows everything down
+    traced_images = min(args["images"], args["trace_images"])
+    traced = ingestion(traced_images)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    traced.run(auto_label=args["auto_label"])
+    after = tracemalloc.take_snapshot()
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    growth = after.compare_to(before, "lineno")
+
+    return {
+        "size": size,
+        "images": processed,
+        "seconds": round(elapsed, 3),
+        "images_per_s": round(processed / elapsed, 2),
+        "stages": timer.summary(),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "alloc_blocks_per_image": round(sum(s.count_diff for s in growth) / traced_images, 1),
+        "alloc_kb_per_image": round(sum(s.size_diff for s in growth) / 1024 / traced_images, 2),
+        "alloc_peak_traced_mb": round(peak_traced / 2 ** 20, 2),
+        "alloc_top": [
+            {"where": str(s.traceback), "kb": round(s.size_diff / 1024, 1), "blocks": s.count_diff}
+            for s in growth[:5]
+        ],
+        "uploaded_mb": round(timed.db.uploaded_bytes / 2 ** 20, 2),
+    }
+
+
+def compare(report: Dict, baseline: Dict) -> None:
+    old = {r["size"]: r for r in baseline["results"]}
+    print(f"\nvs {baseline['timestamp']}:")
+    for r in report["results"]:
+        b = old.get(r["size"])
+        if b is None:
+            continue
+        change = r["images_per_s"] / b["images_per_s"] - 1
+        rss = r["peak_rss_mb"] - b["peak_rss_mb"]
+        print(f"  {r['size']:>5}px: {b['images_per_s']:>8.1f} -> {r['images_per_s']:>8.1f} images/s "
+              f"({change:+.1%}), peak RSS {rss:+.1f} MB")
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ingestion.run against a fake Supabase")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--images", type=int, default=200, help="Images per size")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--no-auto-label", action="store_true")
+    parser.add_argument("--analysis-size", type=int)
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--encode-workers", type=int, default=2)
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--upload-latency", type=float, default=0.0, help="Seconds slept per storage upload")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds slept per table write")
+    parser.add_argument("--trace-images", type=int, default=50, help="Images in the tracemalloc pass")
+    parser.add_argument("--output", default="bench_ingest.json")
+    parser.add_argument("--compare", metavar="JSON", help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    params = {
+        "images": args.images,
+        "batch_size": args.batch_size,
+        "auto_label": not args.no_auto_label,
+        "analysis_size": args.analysis_size,
+        "pipelined": args.pipelined,
+        "encode_workers": args.encode_workers,
+        "upload_workers": args.upload_workers,
+        "upload_latency": args.upload_latency,
+        "db_latency": args.db_latency,
+        "trace_images": args.trace_images,
+    }
+
+    results = []
+    for size in args.sizes:
+        # Fresh process per size: its peak RSS is its own
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(bench_size, size, params).result()
+        results.append(result)
+        stages = ", ".join(f"{name} {s['p50_ms']:.1f}/{s['p99_ms']:.1f}" for name, s in result["stages"].items())
+        print(f"{size:>5}px: {result['images_per_s']:>8.1f} images/s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+              f"{result['alloc_kb_per_image']:.1f} KB / {result['alloc_blocks_per_image']:.0f} blocks retained per image")
+        print(f"         p50/p99 ms: {stages}")
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "params": params,
+        "environment": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+STREAMS OF COLOR - Region Extraction Benchmark
+===============================================
+Landmark regions (FaceMesh cheeks/forehead/hairline polygons) vs the fixed
+rectangles in ColorExtractor: throughput, how often a face is found, how
+long the region masks take to rasterize, and how far the two methods'
+colors and labels drift apart. Also times each dominant-color estimator
+(mean, histogram, kmeans) per region.
+
+Landmark timings need MediaPipe; without it only the rectangle path runs.
+
+Usage:
+    python bench_regions.py --images ./faces --limit 200
+    python bench_regions.py --synthetic 100 --size 512 --output regions.json
+"""
+
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from color_utils import (
+    ColorExtractor, DominantColorEstimator, get_face_mesh, detect_landmarks, face_regions, batch_rgb_to_lab,
+    stack_images
+)
+
+
+def load_images(folder: str, limit: int, size: int) -> List[Image.Image]:
+    paths = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    images = []
+    for path in paths[:limit]:
+        image = Image.open(path)
+        image.draft("RGB", (size, size))
+        images.append(image.convert("RGB").resize((size, size)))
+    return images
+
+
+def synthetic_faces(count: int, size: int, seed: int = 0) -> List[Image.Image]:
+    """Flat skin ellipse under a hair band; FaceMesh rarely fires on these, rectangles always do."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        skin = tuple(int(v) for v in rng.integers([150, 100, 80], [250, 200, 170]))
+        hair = tuple(int(v) for v in rng.integers(10, 180, 3))
+        image = Image.new("RGB", (size, size), tuple(int(v) for v in rng.integers(0, 255, 3)))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse([size * 0.15, 0, size * 0.85, size * 0.45], fill=hair)
+        draw.ellipse([size * 0.22, size * 0.12, size * 0.78, size * 0.9], fill=skin)
+        images.append(image)
+    return images
+
+
+def time_per_image(fn, images) -> np.ndarray:
+    times = []
+    for image in images:
+        start = time.perf_counter()
+        fn(image)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def summarize(ms: np.ndarray) -> Dict:
+    return {
+        "ms_p50": round(float(np.percentile(ms, 50)), 3),
+        "ms_p95": round(float(np.percentile(ms, 95)), 3),
+        "images_per_s": round(float(len(ms) / (ms.sum() / 1000)), 1),
+    }
+
+
+def run(images: List[Image.Image], batch_size: int = 32) -> Dict:
+    report = {"images": len(images), "size": images[0].size[0]}
+
+    rectangles = ColorExtractor(use_mediapipe=False)
+    rect_results = [rectangles.extract_all(image) for image in images]
+    report["rectangles"] = summarize(time_per_image(rectangles.extract_all, images))
+
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        rectangles.extract_batch(stack_images(images[i:i + batch_size]))
+    report["rectangles_batch_images_per_s"] = round(len(images) / (time.perf_counter() - start), 1)
+
+    # Dominant-color estimators on the rectangle regions: time per region, and drift from the mean
+    stack = stack_images(images)
+    baseline = None
+    for method in DominantColorEstimator.METHODS:
+        extractor = ColorExtractor(use_mediapipe=False, estimator=method)
+        skin = np.concatenate([
+            extractor.extract_batch(stack[i:i + batch_size])["skin_rgb"] for i in range(0, len(stack), batch_size)
+        ])
+        baseline = skin if baseline is None else baseline
+        stats = extractor.estimator.stats()
+        delta_e = np.linalg.norm(batch_rgb_to_lab(skin) - batch_rgb_to_lab(baseline), axis=1).mean()
+        report[f"estimator_{method}"] = {
+            "ms_per_region": stats["ms_per_region"], "skin_delta_e_vs_mean": round(float(delta_e), 2)
+        }
+
+    if get_face_mesh() is None:
+        report["landmarks"] = None
+        print("MediaPipe not installed: landmark path skipped")
+        return report
+
+    landmarks = ColorExtractor(use_mediapipe=True)
+    land_results = [landmarks.extract_all(image) for image in images]
+    report["landmarks"] = summarize(time_per_image(landmarks.extract_all, images))
+
+    found = [i for i, r in enumerate(land_results) if r["regions"] == "landmarks"]
+    report["face_found"] = round(len(found) / len(images), 3)
+    if found:
+        arrays = [np.asarray(images[i].convert("RGB")) for i in found]
+        points = [detect_landmarks(img) for img in arrays]
+        start = time.perf_counter()
+        for img, p in zip(arrays, points):
+            face_regions(p, img.shape[:2])
+        report["mask_ms_per_face"] = round(1000 * (time.perf_counter() - start) / len(found), 3)
+
+    # Where a face was found: CIE76 delta E between methods, and label agreement
+    for role in ("skin", "hair"):
+        if found:
+            rect = batch_rgb_to_lab(np.array([rect_results[i][role]["rgb"] for i in found]))
+            land = batch_rgb_to_lab(np.array([land_results[i][role]["rgb"] for i in found]))
+            report[f"{role}_delta_e_mean"] = round(float(np.linalg.norm(rect - land, axis=1).mean()), 2)
+    for label, key in (("undertone", "undertone"), ("depth", "depth"), ("contrast", "contrast_level")):
+        if found:
+            same = sum(rect_results[i][label][key] == land_results[i][label][key] for i in found)
+            report[f"{label}_agreement"] = round(same / len(found), 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark landmark vs rectangle color regions")
+    parser.add_argument("--images", help="Folder of face images (recursive)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N synthetic faces instead")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512, help="Images are resized to size x size")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images, args.limit, args.size)
+    else:
+        images = synthetic_faces(args.synthetic or 50, args.size)
+    if not images:
+        parser.error("no images found")
+
+    report = run(images)
+    for key, value in report.items():
+        print(f"{key:>32}: {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+STREAMS OF COLOR - Analysis Resolution Parity
+==============================================
+How much accuracy auto-labelling gives up when it analyzes a downscaled
+image instead of the full 1024 x 1024 one, and how much time it saves.
+
+For each analysis size the images are decoded the way ingest.py would
+(JPEG draft at the nearest DCT scale, then a box reduce) and run through
+analyze_batch. Colors are compared to full resolution in CIELAB (CIE76
+delta E) and labels by agreement rate.
+
+Usage:
+    python bench_resolution.py --images ./celeba-hq --limit 500
+    python bench_resolution.py --synthetic 200 --sizes 64 128 256 --output parity.json
+"""
+
+import io
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from color_utils import analyze_batch, batch_rgb_to_lab, downscale
+
+LABELS = ["undertone", "depth", "contrast_level"]
+
+
+def load_jpegs(folder: str, limit: int) -> List[bytes]:
+    paths = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg"))
+    return [path.read_bytes() for path in paths[:limit]]
+
+
+def synthetic_jpegs(count: int, size: int = 1024, seed: int = 0) -> List[bytes]:
+    """Blurred face-like layouts with pixel noise, JPEG-encoded like the datasets."""
+    rng = np.random.default_rng(seed)
+    encoded = []
+    for _ in range(count):
+        skin = tuple(int(v) for v in rng.integers([150, 100, 80], [250, 200, 170]))
+        hair = tuple(int(v) for v in rng.integers(10, 180, 3))
+        image = Image.new("RGB", (size, size), tuple(int(v) for v in rng.integers(0, 255, 3)))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse([size * 0.15, 0, size * 0.85, size * 0.45], fill=hair)
+        draw.ellipse([size * 0.22, size * 0.12, size * 0.78, size * 0.9], fill=skin)
+        noisy = np.asarray(image.filter(ImageFilter.GaussianBlur(size / 100)), dtype=np.int16)
+        noisy = np.clip(noisy + rng.integers(-12, 13, noisy.shape), 0, 255).astype(np.uint8)
+
+        buffer = io.BytesIO()
+        Image.fromarray(noisy).save(buffer, format="JPEG", quality=90)
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+def analyze(jpegs: List[bytes], size: Optional[int], batch_size: int = 64) -> Dict:
+    """Decode (drafted to `size`) + analyze_batch, grouped by decoded size; columns in input order."""
+    images = []
+    start = time.perf_counter()
+    for data in jpegs:
+        image = Image.open(io.BytesIO(data))
+        image = downscale(image, size) if size else image
+        images.append(image.convert("RGB"))
+    decode_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    groups: Dict[tuple, List[int]] = {}
+    for i, image in enumerate(images):
+        groups.setdefault(image.size, []).append(i)
+    columns = {"skin_rgb": [None] * len(images), "hair_rgb": [None] * len(images), "subtype": [None] * len(images)}
+    for label in LABELS:
+        columns[label] = [None] * len(images)
+    for indices in groups.values():
+        for b in range(0, len(indices), batch_size):
+            chunk = indices[b:b + batch_size]
+            result = analyze_batch([images[i] for i in chunk])
+            for row, i in enumerate(chunk):
+                columns["skin_rgb"][i] = result["colors"]["skin_rgb"][row]
+                columns["hair_rgb"][i] = result["colors"]["hair_rgb"][row]
+                columns["subtype"][i] = result["prediction"]["subtype"][row]
+                for label in LABELS:
+                    columns[label][i] = result["colors"][label][row]
+    analyze_s = time.perf_counter() - start
+
+    columns["decode_ms"] = 1000 * decode_s / len(jpegs)
+    columns["analyze_ms"] = 1000 * analyze_s / len(jpegs)
+    return columns
+
+
+def parity(full: Dict, reduced: Dict) -> Dict:
+    report = {}
+    for role in ("skin_rgb", "hair_rgb"):
+        delta_e = np.linalg.norm(
+            batch_rgb_to_lab(np.array(full[role])) - batch_rgb_to_lab(np.array(reduced[role])), axis=1
+        )
+        report[f"{role[:4]}_delta_e_mean"] = round(float(delta_e.mean()), 3)
+        report[f"{role[:4]}_delta_e_p95"] = round(float(np.percentile(delta_e, 95)), 3)
+    for label in LABELS + ["subtype"]:
+        same = np.mean([a == b for a, b in zip(full[label], reduced[label])])
+        report[f"{label}_agreement"] = round(float(same), 4)
+    return report
+
+
+def run(jpegs: List[bytes], sizes: List[int]) -> Dict:
+    full = analyze(jpegs, None)
+    full_ms = full["decode_ms"] + full["analyze_ms"]
+    report = {
+        "images": len(jpegs),
+        "full": {"decode_ms": round(full["decode_ms"], 3), "analyze_ms": round(full["analyze_ms"], 3)},
+    }
+    for size in sizes:
+        reduced = analyze(jpegs, size)
+        total_ms = reduced["decode_ms"] + reduced["analyze_ms"]
+        report[str(size)] = {
+            "decode_ms": round(reduced["decode_ms"], 3),
+            "analyze_ms": round(reduced["analyze_ms"], 3),
+            "speedup": round(full_ms / total_ms, 1),
+            "analyze_speedup": round(full["analyze_ms"] / reduced["analyze_ms"], 1),
+            **parity(full, reduced),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy/speed of color analysis at reduced resolution")
+    parser.add_argument("--images", help="Folder of JPEG face images (recursive)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N synthetic 1024px JPEGs instead")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256, 512])
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    jpegs = load_jpegs(args.images, args.limit) if args.images else synthetic_jpegs(args.synthetic or 100)
+    if not jpegs:
+        parser.error("no JPEG images found")
+
+    report = run(jpegs, args.sizes)
+    print(f"{len(jpegs)} images; full resolution: {report['full']['decode_ms']:.2f} ms decode + "
+          f"{report['full']['analyze_ms']:.2f} ms analysis per image")
+    for size in args.sizes:
+        r = report[str(size)]
+        print(f"  {size:>5}px: {r['speedup']:>5}x faster ({r['analyze_speedup']}x analysis), "
+              f"skin dE {r['skin_delta_e_mean']:.2f} (p95 {r['skin_delta_e_p95']:.2f}), "
+              f"hair dE {r['hair_delta_e_mean']:.2f}, "
+              f"labels {r['undertone_agreement']:.1%} / {r['depth_agreement']:.1%} / "
+              f"{r['contrast_level_agreement']:.1%}, subtype {r['subtype_agreement']:.1%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,17 @@ STREAMS OF COLOR - Color Utilities
 Color extraction and analysis tools for Nechama's methodology.
 """
 
+import os
+import sys
+import math
+import time
+import hashlib
+import inspect
+import threading
+
 import numpy as np
-from PIL import Image
-from typing import Dict, List, Tuple, Optional
+from PIL import Image, ImageDraw
+from typing import Callable, Dict, List, Tuple, Optional
 
 
 def rgb_to_hex(rgb: Tuple[int, int, int]) -> str:
@@ -32,48 +40,546 @@ def calculate_warmth(rgb: Tuple[int, int, int]) -> float:
     return (r - b) / 255.0
 
 
-class ColorExtractor:
-    """Extract colors from face images."""
+# =============================================================================
+# BATCH HELPERS
+# =============================================================================
+
+def stack_images(images) -> np.ndarray:
+    """Stack same-size images into an N x H x W x 3 uint8 array."""
+    if isinstance(images, np.ndarray):
+        if images.ndim != 4 or images.shape[-1] != 3:
+            raise ValueError(f"Expected N x H x W x 3 array, got shape {images.shape}")
+        return images.astype(np.uint8, copy=False)
+
+    images = list(images)
+    if not images:
+        return np.empty((0, 0, 0, 3), dtype=np.uint8)
+
+    w, h = images[0].size
+    stack = np.empty((len(images), h, w, 3), dtype=np.uint8)
+    for i, image in enumerate(images):
+        if image.size != (w, h):
+            raise ValueError(f"Image {i} is {image.size}, expected {(w, h)}")
+        stack[i] = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+    return stack
+
+
+def downscale(image: Image.Image, max_side: int) -> Image.Image:
+    """
+    Fit an image within max_side x max_side for analysis.
     
-    def __init__(self, use_mediapipe: bool = True):
-        self.use_mediapipe = use_mediapipe
-        self.face_mesh = None
+    Box-reduces by the largest whole factor, then bilinear for the rest;
+    region means barely move. Unloaded JPEGs are draft-decoded in the DCT
+    domain first (note: `draft` changes `image` in place).
+    """
+    if max(image.size) <= max_side:
+        return image
+    image.draft("RGB", (max_side, max_side))
+    factor = max(image.size) // max_side
+    small = image.reduce(factor) if factor > 1 else image.copy()
+    if max(small.size) > max_side:
+        small.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return small
+
+
+def region_view(
+    stack: np.ndarray,
+    y_range: Tuple[float, float],
+    x_range: Tuple[float, float]
+) -> np.ndarray:
+    """N x h x w x 3 view of a fractional box of every image in a stack."""
+    h, w = stack.shape[1:3]
+    return stack[:, int(h * y_range[0]):int(h * y_range[1]), int(w * x_range[0]):int(w * x_range[1])]
+
+
+def channel_sums(pixels: np.ndarray) -> np.ndarray:
+    """
+    Exact per-channel sums of N x P x 3 uint8 pixels, as float64.
+    
+    One float32 matrix-vector product per 65536-pixel chunk: every partial
+    sum is an integer below 2^24, so it is exact whatever order BLAS adds in,
+    and it runs several times faster than an integer reduction.
+    """
+    n, p = pixels.shape[:2]
+    chunk = 65536  # 65536 * 255 < 2^24
+    ones = np.ones(min(p, chunk), dtype=np.float32)
+    total = np.zeros((n, 3))
+    for start in range(0, p, chunk):
+        block = pixels[:, start:start + chunk].astype(np.float32)
+        total += ones[:block.shape[1]] @ block
+    return total
+
+
+def region_means(
+    stack: np.ndarray,
+    y_range: Tuple[float, float],
+    x_range: Tuple[float, float]
+) -> np.ndarray:
+    """Mean RGB (truncated to int) of a fractional box for every image in a stack."""
+    n, h, w = stack.shape[:3]
+    y1, y2 = int(h * y_range[0]), int(h * y_range[1])
+    x1, x2 = int(w * x_range[0]), int(w * x_range[1])
+
+    # Exact sums, so this matches np.mean(region) bit for bit
+    sums = channel_sums(stack[:, y1:y2, x1:x2].reshape(n, (y2 - y1) * (x2 - x1), 3))
+    return (sums / ((y2 - y1) * (x2 - x1))).astype(int)
+
+
+def batch_luminance(rgb: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_luminance over an N x 3 array."""
+    return (0.299 * rgb[:, 0] + 0.587 * rgb[:, 1] + 0.114 * rgb[:, 2]) / 255.0
+
+
+def batch_warmth(rgb: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_warmth over an N x 3 array."""
+    return (rgb[:, 0] - rgb[:, 2]) / 255.0
+
+
+def batch_rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """sRGB (0-255, ... x 3) to CIELAB (D65), vectorized over any leading shape."""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = linear @ np.array([
+        [0.4124564, 0.2126729, 0.0193339],
+        [0.3575761, 0.7151522, 0.1191920],
+        [0.1804375, 0.0721750, 0.9503041],
+    ]) / np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_HEX_VALUES = np.full(256, -1, dtype=np.int16)  # ASCII code -> digit value
+_HEX_VALUES[_HEX_DIGITS] = np.arange(16)
+_HEX_VALUES[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
+
+def batch_rgb_to_hex(rgb: np.ndarray) -> np.ndarray:
+    """Vectorized rgb_to_hex over an N x 3 array of 0-255 values; returns N strings."""
+    rgb = np.asarray(rgb).astype(np.uint8).reshape(-1, 3)
+    chars = np.empty((len(rgb), 7), dtype=np.uint8)
+    chars[:, 0] = ord("#")
+    chars[:, 1::2] = _HEX_DIGITS[rgb >> 4]
+    chars[:, 2::2] = _HEX_DIGITS[rgb & 15]
+    return chars.view("S7").ravel().astype(str)
+
+
+def batch_hex_to_rgb(hex_colors) -> np.ndarray:
+    """Vectorized hex_to_rgb: N "#rrggbb" (or "rrggbb") strings to an N x 3 int array."""
+    colors = np.asarray(hex_colors, dtype=str).reshape(-1)
+    if colors.dtype.itemsize > 7 * 4:
+        raise ValueError("Expected 6 hex digits per color")
+    # UCS-4 code points, NUL-padded: "#" + 6 digits, or 6 digits + NUL (non-ASCII clipped to invalid)
+    chars = np.minimum(colors.astype("U7").view(np.uint32).reshape(-1, 7), 255)
+    hashed = chars[:, :1] == ord("#")
+    values = _HEX_VALUES[np.where(hashed, chars[:, 1:], chars[:, :6])].astype(int)
+    if (values < 0).any() or (~hashed[:, 0] & (chars[:, 6] != 0)).any():
+        raise ValueError("Expected 6 hex digits per color")
+    return values[:, 0::2] * 16 + values[:, 1::2]
+
+
+def bin_labels(values: np.ndarray, cuts: List[float], labels: List[str]) -> np.ndarray:
+    """
+    Vectorized `if v > cuts[0]: labels[0] elif v > cuts[1]: ... else: labels[-1]`.
+    """
+    index = np.select([values > c for c in cuts], list(range(len(cuts))), len(cuts))
+    return np.asarray(labels)[index]
+
+
+# =============================================================================
+# DOMINANT COLOR
+# =============================================================================
+
+def _box_filter3(counts: np.ndarray) -> np.ndarray:
+    """Sum over each bin's 3 x 3 x 3 neighborhood, for N x b x b x b histograms."""
+    for axis in (1, 2, 3):
+        n = counts.shape[axis]
+        padded = np.pad(counts, [(1, 1) if a == axis else (0, 0) for a in range(counts.ndim)])
+        counts = (padded.take(range(0, n), axis) + padded.take(range(1, n + 1), axis)
+                  + padded.take(range(2, n + 2), axis))
+    return counts
+
+
+class DominantColorEstimator:
+    """
+    Dominant RGB of image regions, one row per region of a batch.
+    
+    - "mean": average of every pixel (exact; the original behavior)
+    - "histogram": mode of a 3-D color histogram (2^bits levels per channel,
+      one np.bincount for the whole batch), smoothed over neighboring bins;
+      returns the mean of the pixels around the mode
+    - "kmeans": mini-batch k-means per region, vectorized across the batch;
+      returns the center of the largest cluster, counting clusters within
+      `merge` (RGB distance) of each other as one
+    
+    "histogram" and "kmeans" first drop the darkest and brightest `trim`
+    fraction of pixels (shadows, highlights) and stride-subsample regions
+    larger than `max_pixels`, so 1024 x 1024 images cost about what 256 x 256
+    ones do. Time spent is accumulated per estimator; see `stats()`.
+    """
+    
+    METHODS = ("mean", "histogram", "kmeans")
+    
+    def __init__(
+        self,
+        method: str = "mean",
+        bits: int = 5,
+        trim: float = 0.05,
+        k: int = 3,
+        iterations: int = 10,
+        batch_pixels: int = 256,
+        merge: float = 24.0,
+        max_pixels: int = 16384,
+        seed: int = 0
+    ):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown estimator {method!r}; expected one of {self.METHODS}")
+        self.method = method
+        self.bits = bits
+        self.trim = trim
+        self.k = k
+        self.iterations = iterations
+        self.batch_pixels = batch_pixels
+        self.merge = merge
+        self.max_pixels = max_pixels
+        self.seed = seed
         
-        if use_mediapipe:
+        self.lock = threading.Lock()
+        self.regions = 0
+        self.seconds = 0.0
+    
+    def __call__(self, region: np.ndarray) -> Tuple[int, int, int]:
+        """Dominant color of one H x W x 3 (or P x 3) region."""
+        return tuple(int(v) for v in self.batch(region[None])[0])
+    
+    def batch(self, regions: np.ndarray) -> np.ndarray:
+        """N x 3 int dominant colors of N x H x W x 3 (or N x P x 3) uint8 regions."""
+        start = time.perf_counter()
+        n = len(regions)
+        if n == 0:
+            return np.zeros((0, 3), dtype=int)
+        if self.method == "mean":
+            # Exact sums, so this matches np.mean(region) bit for bit
+            pixels = regions.reshape(n, -1, 3)
+            result = (channel_sums(pixels) / pixels.shape[1]).astype(int)
+        else:
+            pixels = self._subsample(regions).reshape(n, -1, 3)
+            keep = self._trim_mask(pixels)
+            if self.method == "histogram":
+                result = self._histogram(pixels, keep)
+            else:
+                result = self._kmeans(pixels, keep)
+        
+        with self.lock:
+            self.regions += n
+            self.seconds += time.perf_counter() - start
+        return result
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "method": self.method,
+                "regions": self.regions,
+                "ms_per_region": round(1000 * self.seconds / max(self.regions, 1), 4),
+            }
+    
+    def _subsample(self, regions: np.ndarray) -> np.ndarray:
+        """Strided view of at most ~max_pixels per region (no resampling)."""
+        if regions.ndim == 4:
+            h, w = regions.shape[1:3]
+            step = math.ceil(math.sqrt(h * w / self.max_pixels))
+            return regions[:, ::step, ::step] if step > 1 else regions
+        step = math.ceil(regions.shape[1] / self.max_pixels)
+        return regions[:, ::step] if step > 1 else regions
+    
+    def _trim_mask(self, pixels: np.ndarray) -> Optional[np.ndarray]:
+        """N x P mask without each region's darkest and brightest `trim` fraction."""
+        if self.trim <= 0:
+            return None
+        n, p = pixels.shape[:2]
+        luma = (pixels.astype(np.uint32) @ np.array([299, 587, 114], dtype=np.uint32)) // 1000
+        
+        # Per-region luminance quantiles from a 256-bin histogram, all regions in one bincount
+        hist = np.bincount((luma + 256 * np.arange(n)[:, None]).ravel(), minlength=256 * n).reshape(n, 256)
+        cdf = hist.cumsum(axis=1)
+        low = (cdf <= self.trim * p).sum(axis=1)
+        high = (cdf < (1 - self.trim) * p).sum(axis=1)
+        return (luma >= low[:, None]) & (luma <= high[:, None])
+    
+    def _histogram(self, pixels: np.ndarray, keep: Optional[np.ndarray]) -> np.ndarray:
+        n = len(pixels)
+        bins = 1 << self.bits
+        q = (pixels >> (8 - self.bits)).astype(np.intp)
+        codes = (q[..., 0] << (2 * self.bits)) | (q[..., 1] << self.bits) | q[..., 2]
+        codes += (bins ** 3) * np.arange(n)[:, None]
+        
+        counts = np.bincount(
+            codes.ravel(), weights=None if keep is None else keep.ravel(), minlength=n * bins ** 3
+        ).reshape(n, bins, bins, bins)
+        mode = np.argmax(_box_filter3(counts).reshape(n, -1), axis=1)
+        mode_q = np.stack(np.unravel_index(mode, (bins, bins, bins)), axis=1)
+        
+        # Mean of the pixels in the mode's neighborhood: sub-bin precision, no quantization bias
+        near = (np.abs(q - mode_q[:, None, :]) <= 1).all(axis=2)
+        if keep is not None:
+            near &= keep
+        count = near.sum(axis=1)
+        sums = (pixels * near[..., None]).sum(axis=1, dtype=np.uint64)
+        fallback = pixels.sum(axis=1, dtype=np.uint64) / pixels.shape[1]
+        return np.where(count[:, None] > 0, sums / np.maximum(count, 1)[:, None], fallback).astype(int)
+    
+    def _kmeans(self, pixels: np.ndarray, keep: Optional[np.ndarray]) -> np.ndarray:
+        n, p = pixels.shape[:2]
+        k = self.k
+        x = pixels.astype(np.float32)
+        weight = np.ones((n, p), dtype=np.float32) if keep is None else keep.astype(np.float32)
+        rows = np.arange(n)[:, None]
+        
+        # Deterministic start: pixels at evenly spaced luminance ranks
+        order = np.argsort(x @ np.array([0.299, 0.587, 0.114], dtype=np.float32), axis=1)
+        ranks = ((np.arange(k) + 0.5) / k * p).astype(int)
+        centers = x[rows, order[:, ranks]]
+        seen = np.zeros((n, k), dtype=np.float32)
+        
+        def assign(points):
+            return ((points[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3).argmin(axis=2)
+        
+        rng = np.random.default_rng(self.seed)
+        for _ in range(self.iterations):
+            sample = rng.integers(0, p, (n, min(self.batch_pixels, p)))
+            points = x[rows, sample]
+            onehot = (assign(points)[..., None] == np.arange(k)) * weight[rows, sample][..., None]
+            
+            # Per-center learning rate 1 / (points seen so far), as in mini-batch k-means
+            counts = onehot.sum(axis=1)
+            seen += counts
+            means = np.einsum("npk,npc->nkc", onehot, points) / np.maximum(counts, 1)[..., None]
+            rate = np.where(counts > 0, counts / np.maximum(seen, 1), 0)
+            centers += rate[..., None] * (means - centers)
+        
+        sizes = ((assign(x)[..., None] == np.arange(k)) * weight[..., None]).sum(axis=1)
+
+        # Clusters closer than `merge` are one color split by noise or shading; score them together
+        close = (np.linalg.norm(centers[:, :, None] - centers[:, None], axis=3) < self.merge).astype(np.float32)
+        best = np.einsum("nkj,nj->nk", close, sizes).argmax(axis=1)
+        members = close[np.arange(n), best] * sizes
+        return (np.einsum("nk,nkc->nc", members, centers) / members.sum(axis=1, keepdims=True)).astype(int)
+
+
+# =============================================================================
+# FACE LANDMARKS
+# =============================================================================
+
+# MediaPipe FaceMesh landmark indices (refine_landmarks=True adds the irises, 468-477)
+FACE_REGIONS = {
+    "left_cheek": [117, 118, 101, 36, 205, 187, 123],
+    "right_cheek": [346, 347, 330, 266, 425, 411, 352],
+    "forehead": [67, 109, 10, 338, 297, 299, 296, 336, 9, 107, 66, 69],
+    "lips": [61, 185, 40, 39, 37, 0, 267, 269, 270, 409, 291, 375, 321, 405, 314, 17, 84, 181, 91, 146],
+    "left_iris": [469, 470, 471, 472],
+    "right_iris": [474, 475, 476, 477],
+}
+
+# Upper face oval, left to right; hair is the band above it
+HAIRLINE = [162, 21, 54, 103, 67, 109, 10, 338, 297, 332, 284, 251, 389]
+HAIR_HEIGHT = 0.25  # Band height as a fraction of forehead-to-chin (landmarks 10 and 152)
+
+_face_mesh = None
+_face_mesh_lock = threading.Lock()
+
+
+def get_face_mesh():
+    """
+    The process-wide MediaPipe FaceMesh, built on first use, or None without
+    MediaPipe. Worker processes each build their own once.
+    """
+    global _face_mesh
+    with _face_mesh_lock:
+        if _face_mesh is None:
             try:
                 import mediapipe as mp
-                self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+                _face_mesh = mp.solutions.face_mesh.FaceMesh(
                     static_image_mode=True,
                     max_num_faces=1,
+                    refine_landmarks=True,
                     min_detection_confidence=0.5
                 )
             except ImportError:
+                _face_mesh = False
+        return _face_mesh or None
+
+
+def detect_landmarks(img: np.ndarray, max_side: int = 256) -> Optional[np.ndarray]:
+    """
+    478 x 2 landmark pixel coordinates in `img`, or None if no face is found.
+    
+    Landmarks are normalized, so inference runs on a copy downscaled to
+    `max_side`, which is most of the cost at 1024 x 1024.
+    """
+    mesh = get_face_mesh()
+    if mesh is None:
+        return None
+    
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        small = Image.fromarray(img).resize((round(w * scale), round(h * scale)), Image.Resampling.BILINEAR)
+        img_small = np.asarray(small)
+    else:
+        img_small = img
+    
+    # FaceMesh graphs are not thread-safe
+    with _face_mesh_lock:
+        results = mesh.process(img_small)
+    if not results.multi_face_landmarks:
+        return None
+    points = np.array([(p.x, p.y) for p in results.multi_face_landmarks[0].landmark])
+    return points * [w, h]
+
+
+def polygon_mask(shape: Tuple[int, int], points: np.ndarray) -> np.ndarray:
+    """Boolean mask of a polygon, rasterized over its bounding box only."""
+    h, w = shape
+    vertices = np.round(points).astype(int)
+    x0, y0 = np.maximum(vertices.min(axis=0), 0)
+    x1, y1 = np.minimum(vertices.max(axis=0) + 1, [w, h])
+    mask = np.zeros((h, w), dtype=bool)
+    if x1 <= x0 or y1 <= y0:
+        return mask
+    canvas = Image.new("1", (int(x1 - x0), int(y1 - y0)), 0)
+    ImageDraw.Draw(canvas).polygon([(int(x - x0), int(y - y0)) for x, y in vertices], fill=1)
+    mask[y0:y1, x0:x1] = np.asarray(canvas, dtype=bool)
+    return mask
+
+
+def face_regions(landmarks: np.ndarray, shape: Tuple[int, int]) -> Dict[str, np.ndarray]:
+    """Skin (cheeks + forehead), hair, eye (irises) and lip masks from 478 landmarks."""
+    masks = {name: polygon_mask(shape, landmarks[idx]) for name, idx in FACE_REGIONS.items()}
+    
+    hairline = landmarks[HAIRLINE]
+    lift = HAIR_HEIGHT * np.linalg.norm(landmarks[152] - landmarks[10])
+    band = np.concatenate([hairline, (hairline - [0, lift])[::-1]])
+    
+    return {
+        "skin": masks["left_cheek"] | masks["right_cheek"] | masks["forehead"],
+        "hair": polygon_mask(shape, band),
+        "eye": masks["left_iris"] | masks["right_iris"],
+        "lips": masks["lips"],
+    }
+
+
+class ColorExtractor:
+    """Extract colors from face images."""
+    
+    def __init__(self, use_mediapipe: bool = True, estimator: str = "mean"):
+        self.use_mediapipe = use_mediapipe
+        self.face_mesh = None
+        self.estimator = DominantColorEstimator(estimator)
+        
+        if use_mediapipe:
+            # Shared per process; building a FaceMesh costs far more than one inference
+            self.face_mesh = get_face_mesh()
+            if self.face_mesh is None:
                 print("MediaPipe not available, using region-based extraction")
                 self.use_mediapipe = False
     
     def extract_all(self, image: Image.Image) -> Dict:
         """Extract all color information from image."""
         img_array = np.array(image.convert("RGB"))
+        regions = self.regions(img_array)
         
-        skin = self._extract_skin(img_array)
-        hair = self._extract_hair(img_array)
+        skin = self._extract_skin(img_array, regions)
+        hair = self._extract_hair(img_array, regions)
         
-        return {
+        result = {
             "skin": skin,
             "hair": hair,
             "undertone": self._analyze_undertone(skin["rgb"]),
             "depth": self._analyze_depth(skin["rgb"]),
             "contrast": self._analyze_contrast(skin["rgb"], hair["rgb"]),
+            "regions": "landmarks" if regions else "rectangles",
+        }
+        
+        # Eyes and lips have no rectangle fallback
+        if regions:
+            for name in ("eye", "lips"):
+                if regions[name].any():
+                    rgb = self.estimator(img_array[regions[name]])
+                    result[name] = {"rgb": rgb, "hex": rgb_to_hex(rgb), "luminance": calculate_luminance(rgb)}
+        return result
+    
+    def regions(self, img: np.ndarray) -> Optional[Dict[str, np.ndarray]]:
+        """Landmark region masks, or None (no MediaPipe, or no face found)."""
+        if not self.use_mediapipe:
+            return None
+        landmarks = detect_landmarks(img)
+        return face_regions(landmarks, img.shape[:2]) if landmarks is not None else None
+    
+    def extract_batch(self, images) -> Dict[str, np.ndarray]:
+        """
+        Vectorized extract_all over a stack of same-size images.
+        
+        Accepts an N x H x W x 3 uint8 array or a list of same-size PIL
+        images and returns one column per feature. Values are unrounded;
+        extract_all rounds the same numbers to 3 places for display.
+        """
+        stack = stack_images(images)
+        
+        skin_rgb = self.estimator.batch(region_view(stack, (0.3, 0.65), (0.3, 0.7)))
+        hair_rgb = self.estimator.batch(region_view(stack, (0.0, 0.15), (0.25, 0.75)))
+        
+        # Landmark regions replace the rectangles per image where a face is found
+        if self.use_mediapipe:
+            for i in range(len(stack)):
+                regions = self.regions(stack[i])
+                if regions:
+                    if regions["skin"].any():
+                        skin_rgb[i] = self.estimator(stack[i][regions["skin"]])
+                    if regions["hair"].any():
+                        hair_rgb[i] = self.estimator(stack[i][regions["hair"]])
+        
+        warmth = batch_warmth(skin_rgb)
+        skin_lum = batch_luminance(skin_rgb)
+        hair_lum = batch_luminance(hair_rgb)
+        contrast_val = np.abs(skin_lum - hair_lum)
+        
+        # Same if/elif chain as _analyze_undertone
+        undertone_conds = [warmth > 0.12, warmth < -0.05, warmth > 0.05, warmth < -0.02]
+        undertone = np.select(
+            undertone_conds, ["warm", "cool", "warm-neutral", "cool-neutral"], "neutral"
+        )
+        undertone_conf = np.select(
+            undertone_conds,
+            [np.minimum(warmth * 2, 1.0), np.minimum(np.abs(warmth) * 2, 1.0), 0.6, 0.6],
+            0.7,
+        )
+        
+        return {
+            "skin_rgb": skin_rgb,
+            "hair_rgb": hair_rgb,
+            "skin_luminance": skin_lum,
+            "hair_luminance": hair_lum,
+            "warmth": warmth,
+            "undertone": undertone,
+            "undertone_confidence": undertone_conf,
+            "depth": bin_labels(skin_lum, [0.75, 0.62, 0.48, 0.32], SubtypePredictor.DEPTH_ORDER),
+            "contrast_level": bin_labels(
+                contrast_val, [0.5, 0.38, 0.25, 0.12], SubtypePredictor.CONTRAST_ORDER[::-1]
+            ),
+            "contrast_value": contrast_val,
         }
     
-    def _extract_skin(self, img: np.ndarray) -> Dict:
-        """Extract skin color from face region."""
+    def _extract_skin(self, img: np.ndarray, regions: Optional[Dict] = None) -> Dict:
+        """Extract skin color from cheeks and forehead, or the face region."""
         h, w = img.shape[:2]
         
-        # Center face region (approximation)
-        y1, y2 = int(h * 0.3), int(h * 0.65)
-        x1, x2 = int(w * 0.3), int(w * 0.7)
-        region = img[y1:y2, x1:x2]
+        if regions and regions["skin"].any():
+            region = img[regions["skin"]]
+        else:
+            # Center face region (approximation)
+            y1, y2 = int(h * 0.3), int(h * 0.65)
+            x1, x2 = int(w * 0.3), int(w * 0.7)
+            region = img[y1:y2, x1:x2]
         
         # Get dominant color
         rgb = self._dominant_color(region)
@@ -85,14 +591,17 @@ class ColorExtractor:
             "warmth": calculate_warmth(rgb),
         }
     
-    def _extract_hair(self, img: np.ndarray) -> Dict:
-        """Extract hair color from top region."""
+    def _extract_hair(self, img: np.ndarray, regions: Optional[Dict] = None) -> Dict:
+        """Extract hair color from above the hairline, or the top region."""
         h, w = img.shape[:2]
         
-        # Top of head region
-        y1, y2 = 0, int(h * 0.15)
-        x1, x2 = int(w * 0.25), int(w * 0.75)
-        region = img[y1:y2, x1:x2]
+        if regions and regions["hair"].any():
+            region = img[regions["hair"]]
+        else:
+            # Top of head region
+            y1, y2 = 0, int(h * 0.15)
+            x1, x2 = int(w * 0.25), int(w * 0.75)
+            region = img[y1:y2, x1:x2]
         
         rgb = self._dominant_color(region)
         
@@ -104,9 +613,7 @@ class ColorExtractor:
     
     def _dominant_color(self, region: np.ndarray) -> Tuple[int, int, int]:
         """Get dominant color from region."""
-        pixels = region.reshape(-1, 3)
-        avg = np.mean(pixels, axis=0).astype(int)
-        return tuple(avg)
+        return self.estimator(region)
     
     def _analyze_undertone(self, rgb: Tuple[int, int, int]) -> Dict:
         """Analyze undertone from skin color."""
@@ -292,11 +799,179 @@ class SubtypePredictor:
             return abs(order.index(a) - order.index(b)) == 1
         except ValueError:
             return False
+    
+    @property
+    def compiled(self) -> "CompiledPredictor":
+        """Lookup-table form of SUBTYPES, built on first use."""
+        if "_compiled" not in self.__dict__:
+            self._compiled = CompiledPredictor(self.SUBTYPES)
+        return self._compiled
+    
+    def predict_batch(
+        self,
+        undertones,
+        depths,
+        contrasts,
+        undertone_confidences=None,
+    ) -> List[Dict]:
+        """predict() over whole columns; row i equals predict(undertones[i], ...)."""
+        result = self.compiled.predict_batch(undertones, depths, contrasts, undertone_confidences)
+        predictions = self.compiled.to_dicts(result)
+        for prediction in predictions:
+            prediction["display_name"] = prediction["subtype"].replace("_", " ").title()
+        return predictions
 
 
-def analyze_image(image: Image.Image) -> Dict:
-    """Complete analysis of a face image."""
-    extractor = ColorExtractor(use_mediapipe=False)
+class CompiledPredictor:
+    """
+    Subtype rules compiled into integer-coded lookup tables.
+    
+    Every (undertone, depth, contrast) code triple maps to a precomputed
+    row of 30 scores in a 6 x 6 x 6 cube (5 known values + "unknown" per
+    axis), so scoring N faces is one gather and one multiply. Scores are
+    bit-identical to SubtypePredictor.predict, including tie order.
+    """
+    
+    UNDERTONES = ["warm", "warm-neutral", "neutral", "cool-neutral", "cool"]
+    UNDERTONE_COMPAT = {
+        "warm": ["warm-neutral"],
+        "cool": ["cool-neutral"],
+        "neutral": ["warm-neutral", "cool-neutral"],
+        "warm-neutral": ["warm", "neutral"],
+        "cool-neutral": ["cool", "neutral"],
+    }
+    
+    def __init__(self, subtypes: Dict[str, Dict] = None):
+        subtypes = subtypes or SubtypePredictor.SUBTYPES
+        self.codes = np.array(list(subtypes))
+        self.seasons = np.array([info["season"] for info in subtypes.values()])
+        
+        def adjacent(order):
+            def near(expected, actual):
+                return expected in order and abs(order.index(expected) - order.index(actual)) == 1
+            return near
+        
+        # Partial tables: [actual value code, subtype] -> score contribution
+        self.undertone_table = self._partial_table(
+            subtypes, "undertone", self.UNDERTONES, 0.4, 0.2,
+            lambda expected, actual: actual in self.UNDERTONE_COMPAT.get(expected, []),
+        )
+        self.depth_table = self._partial_table(
+            subtypes, "depth", SubtypePredictor.DEPTH_ORDER, 0.3, 0.15,
+            adjacent(SubtypePredictor.DEPTH_ORDER),
+        )
+        self.contrast_table = self._partial_table(
+            subtypes, "contrast", SubtypePredictor.CONTRAST_ORDER, 0.3, 0.15,
+            adjacent(SubtypePredictor.CONTRAST_ORDER),
+        )
+        
+        # Same summation order as the scalar loop: ((0.0 + u) + d) + c
+        self.score_cube = (
+            self.undertone_table[:, None, None, :]
+            + self.depth_table[None, :, None, :]
+            + self.contrast_table[None, None, :, :]
+        )
+    
+    @staticmethod
+    def _partial_table(subtypes, key, vocab, full, partial, is_near) -> np.ndarray:
+        table = np.zeros((len(vocab) + 1, len(subtypes)))
+        for s, info in enumerate(subtypes.values()):
+            for a, actual in enumerate(vocab):
+                if info[key] == actual:
+                    table[a, s] = full
+                elif is_near(info[key], actual):
+                    table[a, s] = partial
+        return table
+    
+    @staticmethod
+    def encode(values, vocab: List[str]) -> np.ndarray:
+        """Map labels to integer codes; unknown labels get len(vocab)."""
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.integer):
+            return values
+        lookup = {v: i for i, v in enumerate(vocab)}
+        return np.fromiter(
+            (lookup.get(v, len(vocab)) for v in values.tolist()), dtype=np.intp, count=values.size
+        )
+    
+    def score(self, undertones, depths, contrasts, confidences=None) -> np.ndarray:
+        """N x 30 score matrix. Inputs are label arrays or integer codes."""
+        u = self.encode(undertones, self.UNDERTONES)
+        d = self.encode(depths, SubtypePredictor.DEPTH_ORDER)
+        c = self.encode(contrasts, SubtypePredictor.CONTRAST_ORDER)
+        scores = self.score_cube[u, d, c]
+        
+        if confidences is None:
+            confidences = np.ones(len(scores))
+        scores *= (0.5 + 0.5 * np.asarray(confidences, dtype=float))[:, None]
+        return scores
+    
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int = 5):
+        """
+        Indices and scores of the k best subtypes per row, best first.
+        
+        Ties are broken by subtype order, matching the stable sort in
+        SubtypePredictor.predict, so argpartition alone is not enough.
+        """
+        n = scores.shape[1]
+        k = min(k, n)
+        neg = -scores
+        kth = np.partition(neg, k - 1, axis=1)[:, k - 1:k]
+        
+        # 0 = strictly better than the k-th score, 1 = tied with it, 2 = worse
+        tier = (neg >= kth).astype(np.intp) + (neg > kth)
+        candidates = np.argpartition(tier * n + np.arange(n), k - 1, axis=1)[:, :k]
+        
+        candidate_scores = np.take_along_axis(neg, candidates, axis=1)
+        order = np.lexsort((candidates, candidate_scores), axis=-1)
+        index = np.take_along_axis(candidates, order, axis=1)
+        return index, np.take_along_axis(scores, index, axis=1)
+    
+    def predict_batch(self, undertones, depths, contrasts, confidences=None, k: int = 5) -> Dict:
+        """Columnar predictions: best subtype, season, score and top-k."""
+        index, top_scores = self.top_k(self.score(undertones, depths, contrasts, confidences), k)
+        return {
+            "subtype": self.codes[index[:, 0]],
+            "season": self.seasons[index[:, 0]],
+            "confidence": top_scores[:, 0],
+            "top_k": index,
+            "top_k_scores": top_scores,
+        }
+    
+    def to_dicts(self, result: Dict) -> List[Dict]:
+        """Expand predict_batch output into predict()-style dicts."""
+        codes = self.codes.tolist()
+        seasons = self.seasons.tolist()
+        predictions = []
+        for index, scores in zip(result["top_k"].tolist(), result["top_k_scores"].tolist()):
+            predictions.append({
+                "subtype": codes[index[0]],
+                "confidence": round(scores[0], 3),
+                "season": seasons[index[0]],
+                "alternatives": [
+                    {"subtype": codes[i], "confidence": round(s, 3)}
+                    for i, s in zip(index[1:], scores[1:])
+                ],
+            })
+        return predictions
+
+
+def analyze_image(image: Image.Image, estimator: str = "mean", analysis_size: Optional[int] = None) -> Dict:
+    """
+    Complete analysis of a face image, optionally downscaled to analysis_size first.
+    
+    The caller's image is never drafted (see downscale): an unloaded JPEG is
+    drafted through a second handle on its file, or copied if it has none.
+    """
+    extractor = ColorExtractor(use_mediapipe=False, estimator=estimator)
+    if analysis_size and max(image.size) > analysis_size:
+        unloaded = bool(getattr(image, "tile", None))
+        if unloaded and image.format == "JPEG" and getattr(image, "filename", None):
+            with Image.open(image.filename) as source:
+                image = downscale(source, analysis_size)
+        else:
+            image = downscale(image.copy() if unloaded else image, analysis_size)
     predictor = SubtypePredictor()
     
     colors = extractor.extract_all(image)
@@ -314,6 +989,23 @@ def analyze_image(image: Image.Image) -> Dict:
     }
 
 
+def analyze_batch(images, estimator: str = "mean") -> Dict:
+    """Columnar analysis of N same-size face images (see analyze_image)."""
+    extractor = ColorExtractor(use_mediapipe=False, estimator=estimator)
+    colors = extractor.extract_batch(images)
+    
+    # analyze_image feeds the 3-place rounded confidence to the predictor
+    confidence = np.array([round(c, 3) for c in colors["undertone_confidence"].tolist()])
+    prediction = CompiledPredictor().predict_batch(
+        colors["undertone"], colors["depth"], colors["contrast_level"], confidence
+    )
+    
+    return {
+        "colors": colors,
+        "prediction": prediction
+    }
+
+
 # =============================================================================
 # NECHAMA'S COLOR NAMES
 # =============================================================================
@@ -365,6 +1057,26 @@ def classify_eye_color(hex_color: str) -> str:
         return "chocolate_brown" if r < 150 else "golden_brown"
 
 
+def batch_classify_eye_color(rgb: np.ndarray) -> np.ndarray:
+    """classify_eye_color over an N x 3 RGB array (same if/elif chain)."""
+    r, g, b = np.asarray(rgb, dtype=int).reshape(-1, 3).T
+    return np.select(
+        [
+            (r > 150) & (g > 100) & (b < 100),
+            (g > r) & (g > b),
+            (b > r) & (b > g),
+            (np.abs(r - g) < 30) & (np.abs(g - b) < 30),
+        ],
+        [
+            "amber",
+            np.where(g > 150, "jade", "olive"),
+            np.where(b > 150, "sapphire", "steel_blue"),
+            np.where(r < 100, "charcoal", "silver"),
+        ],
+        np.where(r < 150, "chocolate_brown", "golden_brown"),
+    )
+
+
 def classify_hair_color(hex_color: str) -> str:
     """Classify hair color into Nechama's categories."""
     rgb = hex_to_rgb(hex_color)
@@ -385,3 +1097,192 @@ def classify_hair_color(hex_color: str) -> str:
         return "golden_blonde" if warmth > 0.1 else "ash_blonde"
     else:
         return "platinum" if warmth < 0.05 else "champagne"
+
+
+def batch_classify_hair_color(rgb: np.ndarray) -> np.ndarray:
+    """classify_hair_color over an N x 3 RGB array (same thresholds, same float math)."""
+    rgb = np.asarray(rgb, dtype=int).reshape(-1, 3)
+    lum = batch_luminance(rgb)
+    warmth = batch_warmth(rgb)
+    return np.select(
+        [lum < 0.15, lum < 0.25, lum < 0.35, lum < 0.45, lum < 0.55, lum < 0.7],
+        [
+            np.where(warmth < 0, "blue_black", "soft_black"),
+            "espresso",
+            np.where(warmth < 0.1, "dark_chocolate", "auburn"),
+            np.where(warmth < 0.15, "chestnut", "copper"),
+            np.where(warmth > 0.1, "caramel", "mousy_brown"),
+            np.where(warmth > 0.1, "golden_blonde", "ash_blonde"),
+        ],
+        np.where(warmth < 0.05, "platinum", "champagne"),
+    )
+
+
+# =============================================================================
+# COLOR NAME LOOKUP TABLES
+# =============================================================================
+
+# Built tables are cached here (override with STREAMS_OF_COLOR_CACHE)
+LUT_DIR = os.environ.get("STREAMS_OF_COLOR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "streams-of-color"))
+
+# Every name each classifier can return; a table stores indices into these
+EYE_COLOR_LABELS = [
+    "amber", "jade", "olive", "sapphire", "steel_blue", "charcoal", "silver", "chocolate_brown", "golden_brown"
+]
+HAIR_COLOR_LABELS = [
+    "blue_black", "soft_black", "espresso", "dark_chocolate", "auburn", "chestnut", "copper",
+    "caramel", "mousy_brown", "golden_blonde", "ash_blonde", "platinum", "champagne"
+]
+
+
+class ColorLUT:
+    """
+    A color classifier precomputed for all 2^24 RGB values.
+    
+    The table is a 16 MB uint8 array of label indices, indexed by
+    (r << 16) | (g << 8) | b, so classifying any array of colors is one
+    gather. It covers every RGB value (no quantization), so its labels are
+    exactly the classifier's. It is built once from the vectorized
+    classifier, saved as .npy and memory-mapped afterwards (processes share
+    one copy in the page cache).
+    
+    `reference` is the scalar classifier (hex -> name) the vectorized one
+    mirrors. The file name hashes both sources and the module functions and
+    constants they use, so editing a threshold in either rebuilds the table,
+    and a build checks the two still agree on a sample of colors. Tables of
+    earlier versions are left in place (other checkouts may share the
+    directory).
+    """
+    
+    SIZE = 1 << 24
+    
+    def __init__(
+        self,
+        name: str,
+        classify: Callable[[np.ndarray], np.ndarray],
+        labels: List[str],
+        reference: Optional[Callable[[str], str]] = None,
+        cache_dir: Optional[str] = None
+    ):
+        self.name = name
+        self.classify = classify
+        self.reference = reference
+        self.labels = np.array(labels)
+        self.cache_dir = cache_dir
+        self._table: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+    
+    def __call__(self, colors) -> np.ndarray:
+        """Label names for N "#rrggbb" strings or an N x 3 RGB array."""
+        return self.labels[self.codes(colors)]
+    
+    def codes(self, colors) -> np.ndarray:
+        """Label indices (into self.labels) for N hex strings or an N x 3 RGB array."""
+        colors = np.asarray(colors)
+        if colors.dtype.kind in "US":
+            rgb = batch_hex_to_rgb(colors)
+        else:
+            rgb = colors.astype(np.int64).reshape(-1, 3)
+            if rgb.size and (rgb.min() < 0 or rgb.max() > 255):
+                raise ValueError("RGB values must be in 0-255")
+        return self.table[(rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]]
+    
+    @property
+    def table(self) -> np.ndarray:
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = self._load()
+        return self._table
+    
+    @property
+    def path(self) -> str:
+        seen = set()
+        sources = self._sources(self.classify, seen)
+        if self.reference is not None:
+            sources += self._sources(self.reference, seen)
+        digest = hashlib.sha256("\n".join([*sources, *self.labels]).encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir or LUT_DIR, f"{self.name}.{digest}.npy")
+    
+    def _sources(self, fn: Callable, seen: set) -> List[str]:
+        """Source of fn, then of the same-module functions and constants it names, recursively."""
+        seen.add(fn)
+        try:
+            sources = [inspect.getsource(fn)]
+        except (OSError, TypeError):
+            return [fn.__qualname__]
+        module = sys.modules.get(fn.__module__)
+        for name in fn.__code__.co_names:
+            value = getattr(module, name, None)
+            if inspect.isfunction(value) and value.__module__ == fn.__module__ and value not in seen:
+                sources += self._sources(value, seen)
+            elif isinstance(value, (int, float, str, tuple, list, dict)):
+                sources.append(f"{name} = {value!r}")
+        return sources
+    
+    def build(self, chunk: int = 1 << 20) -> np.ndarray:
+        """Classify every RGB value, `chunk` at a time."""
+        self.check()
+        table = np.empty(self.SIZE, dtype=np.uint8)
+        order = np.argsort(self.labels)
+        for start in range(0, self.SIZE, chunk):
+            index = np.arange(start, min(start + chunk, self.SIZE))
+            names = self.classify(np.stack([index >> 16, (index >> 8) & 255, index & 255], axis=1))
+            codes = order[np.searchsorted(self.labels[order], names).clip(max=len(order) - 1)]
+            if not (self.labels[codes] == names).all():
+                raise ValueError(f"{self.name}: classifier returned a name missing from its labels")
+            table[start:start + len(index)] = codes
+        return table
+    
+    def check(self, samples: int = 1 << 17, seed: int = 0):
+        """Raise ValueError if classify and reference disagree on any of `samples` random colors."""
+        if self.reference is None:
+            return
+        rgb = np.random.default_rng(seed).integers(0, 256, (samples, 3))
+        names = self.classify(rgb)
+        for color, name in zip(batch_rgb_to_hex(rgb).tolist(), names.tolist()):
+            expected = self.reference(color)
+            if name != expected:
+                raise ValueError(
+                    f"{self.name}: {self.classify.__name__}({color}) is {name!r} but "
+                    f"{self.reference.__name__} says {expected!r}; update both"
+                )
+    
+    def _load(self) -> np.ndarray:
+        path = self.path
+        try:
+            table = np.load(path, mmap_mode="r")
+            if table.shape == (self.SIZE,) and table.dtype == np.uint8:
+                return table
+        except (OSError, ValueError):
+            pass
+        
+        start = time.perf_counter()
+        table = self.build()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp, path)  # atomic: concurrent builders never expose a partial file
+            table = np.load(path, mmap_mode="r")
+        except OSError as e:
+            print(f"Could not cache {self.name} table at {path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        print(f"Built {self.name} table in {time.perf_counter() - start:.1f}s")
+        return table
+
+
+EYE_COLOR_LUT = ColorLUT("eye_color", batch_classify_eye_color, EYE_COLOR_LABELS, classify_eye_color)
+HAIR_COLOR_LUT = ColorLUT("hair_color", batch_classify_hair_color, HAIR_COLOR_LABELS, classify_hair_color)
+
+
+def classify_eye_colors(colors) -> np.ndarray:
+    """classify_eye_color for N hex strings or an N x 3 RGB array, by table lookup."""
+    return EYE_COLOR_LUT(colors)
+
+
+def classify_hair_colors(colors) -> np.ndarray:
+    """classify_hair_color for N hex strings or an N x 3 RGB array, by table lookup."""
+    return HAIR_COLOR_LUT(colors)
@@ -15,17 +15,43 @@ Usage:
     python fetch_paintings.py --output ./paintings
     python fetch_paintings.py --artist "Monet" --limit 50
     python fetch_paintings.py --all --limit 20
+    python fetch_paintings.py --all --download-images   # + deduplicated local thumbnails
+    python fetch_paintings.py --all --palette 5         # + 5-color palette per painting
+    python fetch_paintings.py --all --workers 16 --base-url met=http://localhost:8000/met
+    python fetch_paintings.py --all --palette 5 --profile profiles/fetch   # pstats + flamegraph stacks
+
+Searches for every (artist, search term, museum) run concurrently on a thread
+pool. Politeness is a token bucket per API host (HOST_RATES) rather than
+fixed sleeps, so the whole run takes about as long as the slowest API's
+request budget.
 """
 
+import io
 import os
 import json
 import time
+import sqlite3
+import random
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
+import colorsys
+import contextlib
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Iterator
 from dataclasses import dataclass, asdict
-from urllib.parse import quote
+from urllib.parse import quote, urlparse, parse_qsl, urlencode
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+from PIL import Image
+
 
 # =============================================================================
 # NECHAMA'S REFERENCED ARTISTS (extracted from algorithm files)
@@ -91,8 +117,396 @@ class Painting:
     dimensions: Optional[str] = None
     department: Optional[str] = None
     culture: Optional[str] = None
-    colors: Optional[List[str]] = None  # Extracted dominant colors if available
+    colors: Optional[List[str]] = None  # Dominant colors as "#rrggbb", most prominent first
     suggested_subtypes: Optional[List[str]] = None
+    image_hash: Optional[str] = None  # SHA-256 of the downloaded thumbnail
+    local_image: Optional[str] = None  # Content-addressed path under the output dir
+
+
+# =============================================================================
+# PALETTES
+# =============================================================================
+
+def normalize_hex(color: str) -> str:
+    """' #ABCDEF' / 'abcdef' -> '#abcdef'"""
+    return "#" + color.strip().lstrip("#").lower()
+
+
+def hsl_to_hex(h: float, s: float, l: float) -> str:
+    """Chicago's color (h 0-360, s and l 0-100) -> '#rrggbb'"""
+    r, g, b = colorsys.hls_to_rgb((h % 360) / 360, l / 100, s / 100)
+    return f"#{round(r * 255):02x}{round(g * 255):02x}{round(b * 255):02x}"
+
+
+def extract_palette(data: bytes, k: int = 5, size: int = 64, iterations: int = 10) -> List[str]:
+    """
+    k dominant colors of an encoded image, largest cluster first.
+    
+    Decodes at reduced size (JPEG draft), seeds k-means from a median-cut
+    quantization and refines with vectorized Lloyd iterations, so the result
+    is deterministic.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB")
+    image.thumbnail((size, size))
+    pixels = np.asarray(image, dtype=np.float32).reshape(-1, 3)
+    
+    seed = image.quantize(colors=k, method=Image.Quantize.MEDIANCUT).getpalette()[:3 * k]
+    centers = np.array(seed, dtype=np.float32).reshape(-1, 3)
+    k = len(centers)
+    
+    def assign(centers):
+        # (pixels, k) squared distances in one broadcast
+        return ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    
+    for _ in range(iterations):
+        labels = assign(centers)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=k) for c in range(3)], axis=1)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        converged = np.allclose(updated, centers, atol=0.5)
+        centers = updated
+        if converged:
+            break
+    
+    counts = np.bincount(assign(centers), minlength=k)
+    return [
+        "#%02x%02x%02x" % tuple(int(round(v)) for v in centers[i])
+        for i in np.argsort(-counts, kind="stable") if counts[i] > 0
+    ]
+
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+
+# Requests per second and burst size per API host, from each API's published limits
+HOST_RATES: Dict[str, Tuple[float, int]] = {
+    "collectionapi.metmuseum.org": (20.0, 20),  # Documented cap is 80/s
+    "api.artic.edu": (1.0, 5),  # 60/min anonymous
+    "www.rijksmuseum.nl": (5.0, 5),
+    "openaccess-api.clevelandart.org": (5.0, 5),
+    "api.harvardartmuseums.org": (2.0, 2),  # 2500/day per key
+}
+DEFAULT_RATE = (10.0, 10)  # Image CDNs, mock servers
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/s, holding at most `burst`."""
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token now (possibly going negative) so waiters queue up fairly
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """One TokenBucket per URL host."""
+    
+    def __init__(self, rates: Dict[str, Tuple[float, int]] = None, default: Tuple[float, int] = DEFAULT_RATE):
+        self.rates = dict(HOST_RATES if rates is None else rates)
+        self.default = default
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+    
+    def wait(self, url: str):
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(*self.rates.get(host, self.default))
+        bucket.acquire()
+
+
+RATE_LIMITER = HostRateLimiter()
+
+
+# =============================================================================
+# HTTP CACHE
+# =============================================================================
+
+# Query parameters carrying API credentials (Rijksmuseum `key`, Harvard `apikey`),
+# left out of cache keys so keys are never stored and rotating one keeps the cache
+SECRET_PARAMS = {"key", "apikey"}
+
+
+class OfflineCacheMiss(requests.ConnectionError):
+    """Raised in offline mode for a request that was never cached."""
+
+
+def cache_key(url: str, params: Optional[Dict] = None) -> str:
+    """The prepared request URL without SECRET_PARAMS."""
+    parts = urlparse(requests.Request("GET", url, params=params).prepare().url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_PARAMS]
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+class ResponseCache:
+    """
+    Persistent cache of 200 responses (local SQLite), keyed by cache_key(): the
+    full URL minus credential params.
+    
+    Entries younger than `ttl` seconds are served without touching the network.
+    Older ones are revalidated with If-None-Match / If-Modified-Since, and a 304
+    just refreshes them. Once the bodies exceed `max_bytes`, the least recently
+    used entries are evicted. `offline` serves every cached entry regardless of
+    age and never goes to the network, for replaying a run in tests and CI.
+    """
+    
+    def __init__(self, path: str, ttl: float = 7 * 86400, max_bytes: int = 512 * 2**20, offline: bool = False):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+        """)
+        self.conn.commit()
+        self._purge_secrets()
+        self.total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.total > self.max_bytes:
+            with self.conn:
+                self._evict()
+        self.counts = {"hits": 0, "revalidated": 0, "misses": 0}
+    
+    def get(self, url: str) -> Optional[Dict]:
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT headers, body, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return {"headers": json.loads(row[0]), "body": row[1], "fresh": time.time() - row[2] < self.ttl}
+    
+    def put(self, url: str, resp: requests.Response):
+        body = resp.content
+        headers = {k: v for k, v in resp.headers.items() if k.lower() in ("content-type", "etag", "last-modified")}
+        now = time.time()
+        with self.lock, self.conn:
+            old = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, headers, body, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(headers), body, len(body), now, now),
+            )
+            self.total += len(body) - (old[0] if old else 0)
+            if self.total > self.max_bytes:
+                self._evict()
+    
+    def count(self, outcome: str):
+        with self.lock:
+            self.counts[outcome] += 1
+    
+    def refresh(self, url: str):
+        """Mark an entry fresh again after a 304."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+    
+    def _purge_secrets(self):
+        """Drop entries keyed with credentials by older versions (URLs then included them)."""
+        with self.conn:
+            for (url,) in self.conn.execute("SELECT url FROM responses WHERE url LIKE '%key=%'").fetchall():
+                if any(k.lower() in SECRET_PARAMS for k, _ in parse_qsl(urlparse(url).query)):
+                    self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+    
+    def _evict(self):
+        # Down to 90% of the cap so eviction doesn't run on every put
+        target = self.max_bytes * 0.9
+        for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall():
+            if self.total <= target:
+                break
+            self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.total -= size
+    
+    @staticmethod
+    def response(url: str, entry: Dict) -> requests.Response:
+        """Rebuild a requests.Response from a cache entry."""
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+        resp._content = entry["body"]
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        return resp
+    
+    def close(self):
+        self.conn.close()
+
+
+# =============================================================================
+# HTTP CLIENT
+# =============================================================================
+
+class HttpClient:
+    """
+    Shared keep-alive session for all museum APIs.
+    
+    One pooled connection set per host (no TCP+TLS handshake per request),
+    the per-host rate limiter, a timeout on every request, and retries with
+    exponential backoff on connection errors, timeouts, 429 and 5xx. A
+    Retry-After header takes precedence over the computed backoff. Every
+    attempt's latency is recorded per host. With a ResponseCache attached,
+    cached responses are served or revalidated first.
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, limiter: HostRateLimiter = None, timeout: float = 30.0, retries: int = 4,
+                 backoff: float = 0.5, max_backoff: float = 60.0, pool_size: int = 32,
+                 cache: ResponseCache = None):
+        self.limiter = limiter or RATE_LIMITER
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+    
+    def get(self, url: str, params: Dict = None, use_cache: bool = True, **kwargs) -> requests.Response:
+        """GET through the cache, then the network with retries."""
+        if self.cache is None:
+            return self._fetch(url, params=params, **kwargs)
+        if not use_cache:
+            if self.cache.offline:
+                raise OfflineCacheMiss(f"Network disabled (offline mode): {url}")
+            return self._fetch(url, params=params, **kwargs)
+        
+        key = cache_key(url, params)
+        entry = self.cache.get(key)
+        if entry is not None and (entry["fresh"] or self.cache.offline):
+            self.cache.count("hits")
+            return self.cache.response(key, entry)
+        if self.cache.offline:
+            raise OfflineCacheMiss(f"Not cached (offline mode): {key}")
+        
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        
+        # The key drops credentials: fetch the real URL
+        resp = self._fetch(url, params=params, headers=headers, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            self.cache.count("revalidated")
+            self.cache.refresh(key)
+            return self.cache.response(key, entry)
+        self.cache.count("misses")
+        if resp.status_code == 200:
+            self.cache.put(key, resp)
+        return resp
+    
+    def _fetch(self, url: str, **kwargs) -> requests.Response:
+        """GET with retries. Returns the last response (possibly non-200) or raises the last error."""
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+        
+        for attempt in range(self.retries + 1):
+            self.limiter.wait(url)
+            start = time.perf_counter()
+            resp, error = None, None
+            try:
+                resp = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            self._record(host, time.perf_counter() - start, resp, attempt)
+            
+            if resp is not None and resp.status_code not in self.RETRY_STATUSES:
+                return resp
+            if attempt == self.retries:
+                if error is not None:
+                    raise error
+                return resp
+            time.sleep(self._delay(attempt, resp))
+    
+    def _delay(self, attempt: int, resp: Optional[requests.Response]) -> float:
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                # HTTP-date form
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0.0), self.max_backoff)
+        # Exponential backoff with jitter so concurrent retries don't line up
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+    
+    def _record(self, host: str, elapsed: float, resp: Optional[requests.Response], attempt: int):
+        with self.lock:
+            self.latencies.setdefault(host, []).append(elapsed)
+            counts = self.counts.setdefault(host, {"requests": 0, "retries": 0, "errors": 0})
+            counts["requests"] += 1
+            counts["retries"] += attempt > 0
+            counts["errors"] += resp is None or resp.status_code != 200
+    
+    def stats(self) -> Dict[str, Dict]:
+        """Per-host request counts and latency percentiles (ms)."""
+        with self.lock:
+            result = {}
+            for host, values in self.latencies.items():
+                ordered = sorted(values)
+                result[host] = {
+                    **self.counts[host],
+                    "mean_ms": round(1000 * sum(ordered) / len(ordered), 1),
+                    "p50_ms": round(1000 * ordered[len(ordered) // 2], 1),
+                    "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                }
+            return result
+    
+    def print_stats(self):
+        if self.cache is not None:
+            c = self.cache.counts
+            print(f"  cache: {c['hits']} hits, {c['revalidated']} revalidated, {c['misses']} fetched")
+        for host, s in sorted(self.stats().items()):
+            print(f"  {host}: {s['requests']} requests ({s['retries']} retries, {s['errors']} errors), "
+                  f"p50 {s['p50_ms']} ms, p95 {s['p95_ms']} ms")
+
+
+HTTP = HttpClient()
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """GET through the shared client (pooling, rate limit, retries)."""
+    return HTTP.get(url, **kwargs)
 
 
 # =============================================================================
@@ -107,38 +521,90 @@ class MetMuseumAPI:
     """
     BASE_URL = "https://collectionapi.metmuseum.org/public/collection/v1"
     
+    def __init__(self, base_url: str = None, workers: int = 8, skip_path: str = None):
+        if base_url:
+            self.BASE_URL = base_url
+        # Object lookups run on their own pool, up to `workers` in flight per search
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="met")
+        
+        # Objects known not to qualify (no image, 404), one ID per line, appended as found.
+        # Only for the real API: IDs from a mock server (base_url) would poison the file.
+        self.skip_path = None if base_url else skip_path
+        self.skip_ids = set()
+        self.skip_lock = threading.Lock()
+        if self.skip_path and os.path.exists(self.skip_path):
+            with open(self.skip_path) as f:
+                self.skip_ids = {int(line) for line in f if line.strip()}
+    
     def search(self, query: str, limit: int = 20) -> List[Painting]:
         """Search Met collection and return paintings with images"""
         paintings = []
         
         # Search for object IDs
         search_url = f"{self.BASE_URL}/search?q={quote(query)}&hasImages=true"
-        resp = requests.get(search_url)
+        resp = http_get(search_url)
         
         if resp.status_code != 200:
             print(f"Met search failed: {resp.status_code}")
             return paintings
         
         data = resp.json()
-        object_ids = data.get("objectIDs", [])[:limit * 2]  # Get extra to filter
+        object_ids = [obj_id for obj_id in data.get("objectIDs") or [] if obj_id not in self.skip_ids]
+        object_ids = object_ids[:limit * 2]  # Get extra to filter
         
-        for obj_id in object_ids:
-            if len(paintings) >= limit:
-                break
-                
-            painting = self._get_object(obj_id)
-            if painting:
-                paintings.append(painting)
-            
-            time.sleep(0.1)  # Rate limiting
+        objects = self._prefetch(object_ids)
+        try:
+            for painting in objects:
+                if painting:
+                    paintings.append(painting)
+                if len(paintings) >= limit:
+                    break
+        finally:
+            objects.close()
         
         return paintings
     
+    def _prefetch(self, object_ids: List[int]) -> Iterator[Optional[Painting]]:
+        """
+        _get_object for each ID, in order, with up to `workers` lookups in flight.
+        
+        Closing the iterator early cancels lookups that haven't started.
+        """
+        ids = iter(object_ids)
+        pending = deque(self.pool.submit(self._get_object, obj_id) for obj_id in itertools.islice(ids, self.workers))
+        try:
+            while pending:
+                painting = pending.popleft().result()
+                for obj_id in itertools.islice(ids, 1):
+                    pending.append(self.pool.submit(self._get_object, obj_id))
+                yield painting
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+    
+    def _skip(self, object_id: int):
+        with self.skip_lock:
+            if object_id in self.skip_ids:
+                return
+            self.skip_ids.add(object_id)
+            if self.skip_path:
+                with open(self.skip_path, "a") as f:
+                    f.write(f"{object_id}\n")
+    
     def _get_object(self, object_id: int) -> Optional[Painting]:
         """Fetch single object details"""
         url = f"{self.BASE_URL}/objects/{object_id}"
-        resp = requests.get(url)
+        try:
+            resp = http_get(url)
+        except requests.RequestException:
+            return None
         
+        if resp.status_code == 404:
+            self._skip(object_id)
         if resp.status_code != 200:
             return None
         
@@ -146,6 +612,7 @@ class MetMuseumAPI:
         
         # Only include if has primary image and is a painting
         if not obj.get("primaryImage"):
+            self._skip(object_id)
             return None
         
         # Filter to paintings (not sculptures, etc)
@@ -183,6 +650,10 @@ class ChicagoArtAPI:
     BASE_URL = "https://api.artic.edu/api/v1"
     IIIF_URL = "https://www.artic.edu/iiif/2"
     
+    def __init__(self, base_url: str = None):
+        if base_url:
+            self.BASE_URL = base_url
+    
     def search(self, query: str, limit: int = 20) -> List[Painting]:
         """Search Chicago Art Institute collection"""
         paintings = []
@@ -194,7 +665,7 @@ class ChicagoArtAPI:
             "fields": "id,title,artist_display,date_display,medium_display,image_id,dimensions,department_title,color",
         }
         
-        resp = requests.get(url, params=params)
+        resp = http_get(url, params=params)
         
         if resp.status_code != 200:
             print(f"Chicago search failed: {resp.status_code}")
@@ -210,7 +681,9 @@ class ChicagoArtAPI:
             # Extract colors if available
             colors = None
             if item.get("color"):
-                colors = [item["color"].get("h"), item["color"].get("s"), item["color"].get("l")]
+                color = item["color"]
+                # Fields can be null (e.g. no hue for a gray)
+                colors = [hsl_to_hex(color.get("h") or 0, color.get("s") or 0, color.get("l") or 0)]
             
             paintings.append(Painting(
                 id=f"chicago_{item['id']}",
@@ -242,8 +715,10 @@ class RijksmuseumAPI:
     """
     BASE_URL = "https://www.rijksmuseum.nl/api/en/collection"
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None):
         self.api_key = api_key or os.getenv("RIJKS_API_KEY")
+        if base_url:
+            self.BASE_URL = base_url
     
     def search(self, query: str, limit: int = 20) -> List[Painting]:
         """Search Rijksmuseum collection"""
@@ -262,7 +737,7 @@ class RijksmuseumAPI:
             "type": "painting",
         }
         
-        resp = requests.get(self.BASE_URL, params=params)
+        resp = http_get(self.BASE_URL, params=params)
         
         if resp.status_code != 200:
             print(f"Rijksmuseum search failed: {resp.status_code}")
@@ -278,7 +753,7 @@ class RijksmuseumAPI:
             # Extract colors if available
             colors = None
             if item.get("colors"):
-                colors = [c.get("hex") for c in item["colors"][:5]]
+                colors = [normalize_hex(c.get("hex")) for c in item["colors"][:5] if c.get("hex")]
             
             paintings.append(Painting(
                 id=f"rijks_{item['objectNumber']}",
@@ -308,6 +783,10 @@ class ClevelandMuseumAPI:
     """
     BASE_URL = "https://openaccess-api.clevelandart.org/api/artworks"
     
+    def __init__(self, base_url: str = None):
+        if base_url:
+            self.BASE_URL = base_url
+    
     def search(self, query: str, limit: int = 20) -> List[Painting]:
         """Search Cleveland Museum collection"""
         paintings = []
@@ -319,7 +798,7 @@ class ClevelandMuseumAPI:
             "type": "Painting",
         }
         
-        resp = requests.get(self.BASE_URL, params=params)
+        resp = http_get(self.BASE_URL, params=params)
         
         if resp.status_code != 200:
             print(f"Cleveland search failed: {resp.status_code}")
@@ -362,8 +841,10 @@ class HarvardArtAPI:
     """
     BASE_URL = "https://api.harvardartmuseums.org"
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None):
         self.api_key = api_key or os.getenv("HARVARD_API_KEY")
+        if base_url:
+            self.BASE_URL = base_url
     
     def search(self, query: str, limit: int = 20) -> List[Painting]:
         """Search Harvard Art Museums collection"""
@@ -382,7 +863,7 @@ class HarvardArtAPI:
             "classification": "Paintings",
         }
         
-        resp = requests.get(f"{self.BASE_URL}/object", params=params)
+        resp = http_get(f"{self.BASE_URL}/object", params=params)
         
         if resp.status_code != 200:
             print(f"Harvard search failed: {resp.status_code}")
@@ -398,7 +879,7 @@ class HarvardArtAPI:
             # Extract colors if available
             colors = None
             if item.get("colors"):
-                colors = [c.get("color") for c in item["colors"][:5]]
+                colors = [normalize_hex(c.get("color")) for c in item["colors"][:5] if c.get("color")]
             
             paintings.append(Painting(
                 id=f"harvard_{item['id']}",
@@ -419,6 +900,173 @@ class HarvardArtAPI:
         return paintings
 
 
+# =============================================================================
+# OUTPUT
+# =============================================================================
+
+class ResultWriter:
+    """
+    Writes results one artist at a time, merged into earlier runs' output.
+    
+    all_paintings.jsonl is an append-only log of every painting written, and
+    the source of truth; the last line for an ID wins. all_paintings.json (an
+    indented JSON array) is extended in place, and summary.json is rewritten
+    from running counts. Neither is ever reloaded. A painting already in the
+    log is written again only if it changed, and then the combined file and
+    summary are rebuilt from the log. After an interruption, the log is
+    trimmed to its last complete line. The combined file and summary are
+    also rebuilt if they fell behind.
+    """
+    
+    def __init__(self, output_dir: str):
+        self.output_path = Path(output_dir)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        self.log_file = self.output_path / "all_paintings.jsonl"
+        self.combined_file = self.output_path / "all_paintings.json"
+        self.summary_file = self.output_path / "summary.json"
+        
+        self.summary = {"total_paintings": 0, "artists": {}, "sources": {}}
+        if self.summary_file.exists():
+            with open(self.summary_file) as f:
+                self.summary.update(json.load(f))
+        
+        if not self.log_file.exists() and self.combined_file.exists():
+            self._seed_log()
+        
+        # Painting ID -> (hash of its latest log line, that line's index)
+        self.seen: Dict[str, Tuple[int, int]] = {}
+        self.lines = 0
+        if self.log_file.exists():
+            self._trim_log()
+            with open(self.log_file) as f:
+                for line in f:
+                    self.seen[json.loads(line)["id"]] = (hash(line.rstrip("\n")), self.lines)
+                    self.lines += 1
+        
+        if not self._combined_ok():
+            self._rebuild()
+        self.log = open(self.log_file, "a")
+    
+    def add(self, artist: str, paintings: List[Painting]):
+        records = [asdict(p) for p in paintings]
+        
+        # Per-artist file
+        filename = self.output_path / f"{artist.lower().replace(' ', '_')}.json"
+        self._write_atomic(filename, json.dumps(records, indent=2))
+        print(f"Saved: {filename} ({len(records)} paintings)")
+        
+        new, changed = [], False
+        for record in records:
+            line = json.dumps(record)
+            previous = self.seen.get(record["id"])
+            if previous is not None and previous[0] == hash(line):
+                continue
+            # Log first: everything else can be rebuilt from it
+            self.log.write(line + "\n")
+            self.seen[record["id"]] = (hash(line), self.lines)
+            self.lines += 1
+            if previous is None:
+                new.append(record)
+            else:
+                changed = True
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        
+        self.summary["artists"][artist] = len(records)
+        if changed:
+            self._rebuild()
+            return
+        self._append_combined(new)
+        for record in new:
+            self.summary["sources"][record["source"]] = self.summary["sources"].get(record["source"], 0) + 1
+        self.summary["total_paintings"] = len(self.seen)
+        self._write_atomic(self.summary_file, json.dumps(self.summary, indent=2))
+    
+    def close(self):
+        self.log.close()
+        print(f"\nSaved combined: {self.combined_file} ({len(self.seen)} total paintings)")
+        print(f"Saved summary: {self.summary_file}")
+    
+    def _append_combined(self, records: List[Dict]):
+        """Splice records in before the closing bracket of all_paintings.json."""
+        if not records:
+            return
+        items = ",\n".join("  " + json.dumps(r, indent=2).replace("\n", "\n  ") for r in records)
+        had_items = len(self.seen) > len(records)
+        with open(self.combined_file, "rb+") as f:
+            f.seek(-2, os.SEEK_END)  # "\n]"
+            f.write(((",\n" if had_items else "") + items + "\n]").encode())
+            f.truncate()
+    
+    def _combined_ok(self) -> bool:
+        if not self.combined_file.exists() or self.summary["total_paintings"] != len(self.seen):
+            return False
+        with open(self.combined_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < 3:
+                return False
+            f.seek(-2, os.SEEK_END)
+            return f.read() == b"\n]"
+    
+    def _rebuild(self):
+        """Regenerate all_paintings.json and summary counts by streaming the log (latest line per ID)."""
+        sources: Dict[str, int] = {}
+        latest = {index for _, index in self.seen.values()}
+        tmp = self.combined_file.with_suffix(".json.tmp")
+        with open(tmp, "w") as out:
+            out.write("[\n")
+            if self.log_file.exists():
+                with open(self.log_file) as f:
+                    for i, line in enumerate(f):
+                        if i not in latest:
+                            continue
+                        record = json.loads(line)
+                        out.write((",\n" if sources else "") + "  " + json.dumps(record, indent=2).replace("\n", "\n  "))
+                        sources[record["source"]] = sources.get(record["source"], 0) + 1
+            out.write("\n]")
+        os.replace(tmp, self.combined_file)
+        
+        self.summary["sources"] = sources
+        self.summary["total_paintings"] = len(self.seen)
+        self._write_atomic(self.summary_file, json.dumps(self.summary, indent=2))
+    
+    def _seed_log(self):
+        """One-time import of an all_paintings.json written before the log existed."""
+        with open(self.combined_file) as f:
+            records = json.load(f)
+        ids = set()
+        with open(self.log_file, "w") as f:
+            for record in records:
+                if record["id"] not in ids:
+                    ids.add(record["id"])
+                    f.write(json.dumps(record) + "\n")
+        self.summary["total_paintings"] = -1  # Force a rebuild in the new layout
+    
+    def _trim_log(self):
+        """Drop a torn last line left by an interrupted write."""
+        with open(self.log_file, "rb+") as f:
+            data_end = f.seek(0, os.SEEK_END)
+            position = data_end
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != data_end:
+                f.truncate(position)
+    
+    @staticmethod
+    def _write_atomic(path: Path, text: str):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
 # =============================================================================
 # MAIN FETCHER
 # =============================================================================
@@ -426,50 +1074,97 @@ class HarvardArtAPI:
 class ArtFetcher:
     """Main class to fetch art from all APIs"""
     
-    def __init__(self, rijks_key: str = None, harvard_key: str = None):
-        self.met = MetMuseumAPI()
-        self.chicago = ChicagoArtAPI()
-        self.rijks = RijksmuseumAPI(rijks_key)
-        self.cleveland = ClevelandMuseumAPI()
-        self.harvard = HarvardArtAPI(harvard_key)
+    def __init__(self, rijks_key: str = None, harvard_key: str = None,
+                 image_dir: str = None, max_distance: int = 4,
+                 workers: int = 8, base_urls: Dict[str, str] = None, met_skip_path: str = None,
+                 palette_size: int = 0):
+        # base_urls: source name (met, chicago, rijks, cleveland, harvard) -> URL, e.g. a mock server
+        base_urls = base_urls or {}
+        self.met = MetMuseumAPI(base_urls.get("met"), workers, met_skip_path)
+        self.chicago = ChicagoArtAPI(base_urls.get("chicago"))
+        self.rijks = RijksmuseumAPI(rijks_key, base_urls.get("rijks"))
+        self.cleveland = ClevelandMuseumAPI(base_urls.get("cleveland"))
+        self.harvard = HarvardArtAPI(harvard_key, base_urls.get("harvard"))
+        self.workers = workers
+        
+        # Palette extraction (0 = keep API-provided colors only)
+        self.palette_size = palette_size
+        self.palette_pool: Optional[ProcessPoolExecutor] = None
+        
+        # Optional image download + content-hash dedup (see image_hash.py)
+        self.image_dir = Path(image_dir) if image_dir else None
+        self.max_distance = max_distance
+        self.index = None
+        if self.image_dir:
+            from image_hash import ImageIndex  # Only needed with --download-images
+            self.image_dir.mkdir(parents=True, exist_ok=True)
+            self.index = ImageIndex(str(self.image_dir / "image_index.sqlite"))
     
     def fetch_artist(self, artist_name: str, limit_per_source: int = 10) -> List[Painting]:
         """Fetch paintings by a specific artist from all sources"""
-        all_paintings = []
-        search_terms = NECHAMA_ARTISTS.get(artist_name, [artist_name])
+        return self.fetch_artists([artist_name], limit_per_source)[artist_name]
+    
+    def fetch_artists(self, artists: List[str], limit_per_source: int = 10) -> Dict[str, List[Painting]]:
+        """Fetch several artists concurrently (see iter_artists)"""
+        return dict(self.iter_artists(artists, limit_per_source))
+    
+    def iter_artists(self, artists: Iterable[str], limit_per_source: int = 10) -> Iterator[Tuple[str, List[Painting]]]:
+        """
+        Yield (artist, paintings) in order as each artist completes.
         
-        for term in search_terms:
-            print(f"  Searching for: {term}")
-            
-            # Met Museum
-            paintings = self.met.search(term, limit_per_source)
-            print(f"    Met: {len(paintings)} paintings")
-            all_paintings.extend(paintings)
-            
-            # Chicago
-            paintings = self.chicago.search(term, limit_per_source)
-            print(f"    Chicago: {len(paintings)} paintings")
-            all_paintings.extend(paintings)
-            
-            # Cleveland
-            paintings = self.cleveland.search(term, limit_per_source)
-            print(f"    Cleveland: {len(paintings)} paintings")
-            all_paintings.extend(paintings)
-            
-            # Rijksmuseum (if key available)
-            paintings = self.rijks.search(term, limit_per_source)
-            if paintings:
-                print(f"    Rijksmuseum: {len(paintings)} paintings")
-                all_paintings.extend(paintings)
+        Every (artist, term, museum) search runs on a thread pool, with about
+        2x `workers` searches queued ahead of the artist being yielded, so
+        memory doesn't grow with the number of artists. Results are assembled
+        in the same term / museum order as a serial run, so deduplication
+        keeps the same paintings.
+        """
+        sources = self._sources()
+        remaining = iter(artists)
+        
+        with ThreadPoolExecutor(self.workers) as pool:
+            queued = deque()  # (artist, [(term, name, future)])
             
-            # Harvard (if key available)
-            paintings = self.harvard.search(term, limit_per_source)
-            if paintings:
-                print(f"    Harvard: {len(paintings)} paintings")
-                all_paintings.extend(paintings)
+            def fill():
+                while sum(len(futures) for _, futures in queued) < 2 * self.workers:
+                    artist = next(remaining, None)
+                    if artist is None:
+                        return
+                    queued.append((artist, [
+                        (term, name, pool.submit(self._search, name, api, term, limit_per_source))
+                        for term in NECHAMA_ARTISTS.get(artist, [artist])
+                        for name, api in sources
+                    ]))
             
-            time.sleep(0.5)  # Be nice to APIs
-        
+            fill()
+            while queued:
+                artist, futures = queued.popleft()
+                found = []
+                for term, name, future in futures:
+                    paintings = future.result()
+                    print(f"  {artist} / {term} / {name}: {len(paintings)} paintings")
+                    found.extend(paintings)
+                # Keep searching ahead while this artist is post-processed and written
+                fill()
+                yield artist, self._finish(artist, found)
+    
+    def _sources(self) -> List[Tuple[str, Any]]:
+        sources = [("Met", self.met), ("Chicago", self.chicago), ("Cleveland", self.cleveland)]
+        # Keyed APIs only if a key is available
+        for name, api in (("Rijksmuseum", self.rijks), ("Harvard", self.harvard)):
+            if api.api_key:
+                sources.append((name, api))
+            else:
+                print(f"{name}: skipped (no API key)")
+        return sources
+    
+    def _search(self, name: str, api, term: str, limit: int) -> List[Painting]:
+        try:
+            return api.search(term, limit)
+        except requests.RequestException as e:
+            print(f"{name} search error ({term}): {e}")
+            return []
+    
+    def _finish(self, artist_name: str, all_paintings: List[Painting]) -> List[Painting]:
         # Add suggested subtypes
         subtypes = ARTIST_SUBTYPES.get(artist_name, [])
         for p in all_paintings:
@@ -482,57 +1177,145 @@ class ArtFetcher:
             if key not in unique:
                 unique[key] = p
         
-        return list(unique.values())
+        paintings = list(unique.values())
+        if self.index is not None:
+            paintings = self.download_images(paintings)
+        if self.palette_size:
+            self.extract_palettes(paintings)
+        return paintings
+    
+    def download_images(self, paintings: List[Painting]) -> List[Painting]:
+        """
+        Download thumbnails into images/<sha[:2]>/<sha>.jpg and drop duplicates.
+        
+        URLs seen on an earlier run are not fetched again. Two paintings whose
+        images match exactly, or within max_distance dHash bits (the same work
+        served by two museums), keep only the first. Downloads run concurrently;
+        hashing and indexing stay in painting order so the same record wins.
+        """
+        urls = [p.thumbnail_url or p.image_url for p in paintings]
+        with ThreadPoolExecutor(self.workers) as pool:
+            downloads = list(pool.map(self._download, urls))
+        
+        kept, seen = [], set()
+        for p, url, data in zip(paintings, urls, downloads):
+            sha = self._image_sha(url, data)
+            if sha is not None:
+                if sha in seen:
+                    continue
+                seen.add(sha)
+                p.image_hash = sha
+                p.local_image = self.index.get(sha)["key"]
+            kept.append(p)
+        
+        if len(kept) < len(paintings):
+            print(f"    Dropped {len(paintings) - len(kept)} duplicate images")
+        return kept
+    
+    def _download(self, url: str) -> Optional[bytes]:
+        """Image bytes, or None if `url` is empty, already indexed, or fails."""
+        if not url or self.index.sha_for_url(url) is not None:
+            return None
+        try:
+            # Bytes are kept content-addressed; no need to cache them too
+            response = http_get(url, use_cache=False)
+            response.raise_for_status()
+            return response.content
+        except requests.RequestException as e:
+            print(f"Image download error ({url}): {e}")
+            return None
+    
+    def _image_sha(self, url: str, data: Optional[bytes]) -> Optional[str]:
+        """Content hash of the image at `url`, indexing freshly downloaded `data` if new."""
+        from image_hash import sha256_hex, dhash, content_path
+        
+        if not url:
+            return None
+        sha = self.index.sha_for_url(url)
+        if sha is not None or data is None:
+            return sha
+        
+        try:
+            image_hash = dhash(Image.open(io.BytesIO(data)))
+        except Exception as e:
+            print(f"Image error ({url}): {e}")
+            return None
+        
+        sha = sha256_hex(data)
+        duplicate = self.index.find(sha, image_hash, self.max_distance)
+        if duplicate is not None:
+            # Map this URL onto the image already stored
+            self.index.add(duplicate["sha256"], duplicate["dhash"], duplicate["kind"], duplicate["key"], url=url)
+            return duplicate["sha256"]
+        
+        key = content_path("images", sha)
+        path = self.image_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        self.index.add(sha, image_hash, "painting", key, url=url)
+        return sha
     
+    def extract_palettes(self, paintings: List[Painting]):
+        """
+        Set `colors` on every painting to the palette of its thumbnail.
+        
+        Thumbnails come from the local image store when downloaded, otherwise
+        through the HTTP client (and its response cache) on a thread pool.
+        k-means runs on a process pool. Paintings whose image can't be fetched
+        keep the colors their API provided.
+        """
+        if self.palette_pool is None:
+            self.palette_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [
+                self.palette_pool.submit(extract_palette, data, self.palette_size) if data else None
+                for data in pool.map(self._thumbnail_bytes, paintings)
+            ]
+        
+        for p, future in zip(paintings, futures):
+            if future is None:
+                continue
+            try:
+                p.colors = future.result()
+            except Exception as e:
+                print(f"Palette error ({p.id}): {e}")
+    
+    def _thumbnail_bytes(self, painting: Painting) -> Optional[bytes]:
+        if painting.local_image and self.image_dir:
+            return (self.image_dir / painting.local_image).read_bytes()
+        url = painting.thumbnail_url or painting.image_url
+        if not url:
+            return None
+        try:
+            response = http_get(url)
+        except requests.RequestException as e:
+            print(f"Image download error ({url}): {e}")
+            return None
+        return response.content if response.status_code == 200 else None
+    
+    def close(self):
+        self.met.close()
+        if self.palette_pool is not None:
+            self.palette_pool.shutdown()
+            self.palette_pool = None
+
     def fetch_all_nechama_artists(self, limit_per_source: int = 10) -> Dict[str, List[Painting]]:
         """Fetch paintings for all artists Nechama references"""
         results = {}
-        
-        for artist in NECHAMA_ARTISTS.keys():
-            print(f"\n🎨 Fetching: {artist}")
-            paintings = self.fetch_artist(artist, limit_per_source)
+        for artist, paintings in self.iter_artists(NECHAMA_ARTISTS.keys(), limit_per_source):
             results[artist] = paintings
-            print(f"  Total: {len(paintings)} unique paintings")
+            print(f"🎨 {artist}: {len(paintings)} unique paintings")
         
         return results
     
     def save_results(self, results: Dict[str, List[Painting]], output_dir: str):
-        """Save results to JSON files"""
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
-        
-        # Save per-artist files
+        """Save results to JSON files, merged into any earlier run's output"""
+        writer = ResultWriter(output_dir)
         for artist, paintings in results.items():
-            filename = output_path / f"{artist.lower().replace(' ', '_')}.json"
-            with open(filename, 'w') as f:
-                json.dump([asdict(p) for p in paintings], f, indent=2)
-            print(f"Saved: {filename} ({len(paintings)} paintings)")
-        
-        # Save combined file
-        all_paintings = []
-        for paintings in results.values():
-            all_paintings.extend(paintings)
-        
-        combined_file = output_path / "all_paintings.json"
-        with open(combined_file, 'w') as f:
-            json.dump([asdict(p) for p in all_paintings], f, indent=2)
-        print(f"\nSaved combined: {combined_file} ({len(all_paintings)} total paintings)")
-        
-        # Save summary
-        summary = {
-            "total_paintings": len(all_paintings),
-            "artists": {artist: len(paintings) for artist, paintings in results.items()},
-            "sources": {},
-        }
-        for p in all_paintings:
-            summary["sources"][p.source] = summary["sources"].get(p.source, 0) + 1
-        
-        summary_file = output_path / "summary.json"
-        with open(summary_file, 'w') as f:
-            json.dump(summary, f, indent=2)
-        print(f"Saved summary: {summary_file}")
-        
-        return combined_file
+            writer.add(artist, paintings)
+        writer.close()
+        return writer.combined_file
 
 
 def main():
@@ -543,30 +1326,80 @@ def main():
     parser.add_argument("--limit", "-l", type=int, default=10, help="Limit per source per artist")
     parser.add_argument("--rijks-key", help="Rijksmuseum API key")
     parser.add_argument("--harvard-key", help="Harvard Art Museums API key")
+    parser.add_argument("--workers", "-w", type=int, default=8, help="Concurrent searches")
+    parser.add_argument("--base-url", action="append", default=[], metavar="SOURCE=URL",
+                        help="Override an API base URL, e.g. met=http://localhost:8000/met (repeatable)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout (seconds)")
+    parser.add_argument("--retries", type=int, default=4, help="Retries on errors, 429 and 5xx")
+    parser.add_argument("--cache", default=None,
+                        help="HTTP response cache (default: <output>/http_cache.sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="Always go to the network")
+    parser.add_argument("--cache-ttl", type=float, default=7.0, help="Days before a cached response is revalidated")
+    parser.add_argument("--cache-size", type=int, default=512, help="Cache size cap in MB (LRU eviction)")
+    parser.add_argument("--offline", action="store_true", help="Serve only from the cache; never touch the network")
+    parser.add_argument("--palette", type=int, default=0, metavar="K",
+                        help="Extract a K-color palette from every thumbnail (e.g. 5)")
+    parser.add_argument("--download-images", action="store_true",
+                        help="Download thumbnails into <output>/images, skipping duplicates")
+    parser.add_argument("--max-distance", type=int, default=4,
+                        help="dHash bits within which two images count as the same painting")
+    parser.add_argument("--profile", metavar="PREFIX",
+                        help="Write PREFIX.pstats (cProfile) and PREFIX.collapsed (sampled stacks, for flamegraphs)")
+    # Profiler.MODES, spelled out: profiling.py is only imported with --profile
+    parser.add_argument("--profile-mode", choices=("both", "cprofile", "sample"), default="both")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Also write PREFIX.alloc.txt: top tracemalloc allocation sites per painting")
     
     args = parser.parse_args()
     
+    HTTP.timeout = args.timeout
+    HTTP.retries = args.retries
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    if not args.no_cache:
+        HTTP.cache = ResponseCache(
+            args.cache or str(Path(args.output) / "http_cache.sqlite"),
+            ttl=args.cache_ttl * 86400,
+            max_bytes=args.cache_size * 2**20,
+            offline=args.offline,
+        )
+    
     fetcher = ArtFetcher(
         rijks_key=args.rijks_key,
-        harvard_key=args.harvard_key
+        harvard_key=args.harvard_key,
+        image_dir=args.output if args.download_images else None,
+        max_distance=args.max_distance,
+        workers=args.workers,
+        met_skip_path=str(Path(args.output) / "met_skip_ids.txt"),
+        palette_size=args.palette,
+        base_urls=dict(item.split("=", 1) for item in args.base_url)
     )
     
     if args.artist:
         print(f"🎨 Fetching paintings by: {args.artist}")
-        paintings = fetcher.fetch_artist(args.artist, args.limit)
-        results = {args.artist: paintings}
+        artists = [args.artist]
     elif args.all:
         print("🎨 Fetching all Nechama's referenced artists...")
-        results = fetcher.fetch_all_nechama_artists(args.limit)
+        artists = list(NECHAMA_ARTISTS.keys())
     else:
         # Default: fetch a sample
         print("🎨 Fetching sample (Monet, Vermeer, Sargent)...")
-        results = {}
-        for artist in ["Monet", "Vermeer", "Sargent"]:
-            paintings = fetcher.fetch_artist(artist, args.limit)
-            results[artist] = paintings
+        artists = ["Monet", "Vermeer", "Sargent"]
     
-    fetcher.save_results(results, args.output)
+    # Each artist is written as soon as it completes, so an interrupted run keeps its progress
+    writer = ResultWriter(args.output)
+    profiler = None
+    if args.profile:
+        from profiling import Profiler  # Only needed with --profile
+        profiler = Profiler(args.profile, args.profile_mode, memory=args.profile_memory)
+    with profiler or contextlib.nullcontext():
+        for artist, paintings in fetcher.iter_artists(artists, args.limit):
+            writer.add(artist, paintings)
+            if profiler:
+                profiler.items += len(paintings)
+    writer.close()
+    fetcher.close()
+    print("\nHTTP:")
+    HTTP.print_stats()
     print("\n✅ Done!")
 
 
@@ -0,0 +1,201 @@
+"""
+STREAMS OF COLOR - Image Deduplication Index
+=============================================
+Content-addressed index shared by ingest.py and fetch_paintings.py.
+
+Every stored image is keyed by the SHA-256 of its bytes (exact duplicates)
+and carries a 64-bit dHash (near duplicates: re-encodes, resizes, the same
+painting served by two museums). Near-duplicate lookups walk a BK-tree, so
+they touch a small fraction of the index instead of scanning it.
+
+Usage:
+    index = ImageIndex("image_index.sqlite")
+    sha, dh = sha256_hex(data), dhash(image)
+    if index.find(sha, dh, max_distance=4) is None:
+        index.add(sha, dh, "painting", f"images/{sha[:2]}/{sha}.jpg")
+"""
+
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+def sha256_hex(data: bytes) -> str:
+    """Exact content hash."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """Difference hash: 1 bit per horizontally adjacent pixel pair of a (size+1) x size thumbnail."""
+    small = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def content_path(folder: str, sha: str, suffix: str = ".jpg") -> str:
+    """Storage path keyed by content hash, fanned out over 256 prefixes."""
+    return f"{folder}/{sha[:2]}/{sha}{suffix}"
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes under Hamming distance."""
+
+    def __init__(self):
+        self.root: Optional[list] = None  # [hash, value, {distance: child}]
+        self.size = 0
+
+    def add(self, value_hash: int, value) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [value_hash, value, {}]
+            return
+
+        node = self.root
+        while True:
+            d = hamming(value_hash, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value_hash, value, {}]
+                return
+            node = child
+
+    def search(self, value_hash: int, max_distance: int) -> List[Tuple[int, object]]:
+        """All (distance, value) within max_distance, closest first."""
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value_hash, node[0])
+            if d <= max_distance:
+                found.append((d, node[1]))
+            # Triangle inequality: only children at distance d +/- max_distance can match
+            for child_d, child in node[2].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    stack.append(child)
+        return sorted(found, key=lambda x: x[0])
+
+
+class ImageIndex:
+    """
+    Persistent SHA-256 + dHash index (local SQLite) with an in-memory BK-tree.
+
+    Thread-safe. `reserve` marks a hash as in flight so two workers holding
+    the same image (or, with max_distance, a near duplicate) can't both
+    upload it; `add` records it once stored, and `release` drops a
+    reservation whose upload failed.
+
+    Several processes can share one index file: every lookup first adds
+    rows other processes stored since the last one to the BK-tree. Their
+    in-flight reservations are not shared, though, so two processes holding
+    the same image at the same moment may both store it.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                sha256 TEXT PRIMARY KEY,
+                dhash INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                added_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+        self.tree = BKTree()
+        self._pending: Dict[str, int] = {}  # sha256 -> dhash of reserved images
+        self._synced_rowid = 0
+        self._sync()
+
+    def _sync(self) -> None:
+        """Add rows stored since the last sync, by any process, to the BK-tree (caller holds the lock)."""
+        rows = self.conn.execute(
+            "SELECT rowid, sha256, dhash FROM images WHERE rowid > ? ORDER BY rowid", (self._synced_rowid,)
+        ).fetchall()
+        for rowid, sha, signed_hash in rows:
+            self.tree.add(signed_hash & 0xFFFFFFFFFFFFFFFF, sha)
+            self._synced_rowid = rowid
+
+    def __len__(self) -> int:
+        return self.tree.size
+
+    def get(self, sha: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT sha256, dhash, kind, key FROM images WHERE sha256 = ?", (sha,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"sha256": row[0], "dhash": row[1] & 0xFFFFFFFFFFFFFFFF, "kind": row[2], "key": row[3]}
+
+    def find(self, sha: str, image_hash: int, max_distance: int = 0) -> Optional[Dict]:
+        """The stored image this one duplicates (exactly or within max_distance bits), if any."""
+        exact = self.get(sha)
+        if exact is not None:
+            return exact
+        with self.lock:
+            self._sync()
+            matches = self.tree.search(image_hash, max_distance)
+        return self.get(matches[0][1]) if matches else None
+
+    def reserve(self, sha: str, image_hash: int, max_distance: int = 0) -> Optional[Dict]:
+        """Like find(), but also counts in-flight hashes; reserves `sha` if it is new."""
+        duplicate = self.find(sha, image_hash, max_distance)
+        if duplicate is not None:
+            return duplicate
+        with self.lock:
+            for pending_sha, pending_hash in self._pending.items():
+                if pending_sha == sha or hamming(image_hash, pending_hash) <= max_distance:
+                    return {"sha256": pending_sha, "dhash": pending_hash, "kind": "pending", "key": None}
+            self._pending[sha] = image_hash
+        return None
+
+    def release(self, sha: str) -> None:
+        with self.lock:
+            self._pending.pop(sha, None)
+
+    def add(self, sha: str, image_hash: int, kind: str, key: str, url: Optional[str] = None) -> None:
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO images (sha256, dhash, kind, key, added_at) VALUES (?, ?, ?, ?, ?)",
+                # SQLite integers are signed 64-bit
+                (sha, image_hash - (1 << 64) if image_hash >= 1 << 63 else image_hash,
+                 kind, key, datetime.utcnow().isoformat()),
+            )
+            if url:
+                self.conn.execute("INSERT OR REPLACE INTO urls (url, sha256) VALUES (?, ?)", (url, sha))
+            if cursor.rowcount:
+                self._sync()
+            self._pending.pop(sha, None)
+
+    def sha_for_url(self, url: str) -> Optional[str]:
+        """Content hash of a URL downloaded before, so it need not be fetched again."""
+        with self.lock:
+            row = self.conn.execute("SELECT sha256 FROM urls WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.conn.close()
@@ -6,13 +6,29 @@ Nechama Yaffe's 30-Subtype Color Analysis System
 Usage:
     python ingest.py --max-images 1000 --auto-label
     python ingest.py --max-images 5000 --batch-size 100
+    python ingest.py --max-images 5000 --pipelined --upload-workers 16
+    python ingest.py --max-images 5000 --resume
+    python ingest.py --max-images 70000 --workers 8 --num-shards 4 --shard-index 0
+    python ingest.py --local ./ffhq/images1024x1024 --max-images 70000 --workers 8
+    python ingest.py --max-images 5000 --pipelined --metrics-interval 10 --metrics-port 9108
+    python ingest.py --max-images 2000 --auto-label --profile profiles/ingest --profile-memory
 """
 
 import os
 import io
+import mmap
+import queue
+import struct
+import zipfile
+import sqlite3
 import argparse
-from typing import Optional, Dict, List
-from dataclasses import dataclass, field
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Dict, List, Iterable, Iterator, Callable
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from enum import Enum
 
@@ -22,6 +38,14 @@ from PIL import Image
 from tqdm import tqdm
 import numpy as np
 
+from color_utils import (
+    stack_images, batch_luminance, batch_warmth, bin_labels, CompiledPredictor,
+    get_face_mesh, detect_landmarks, face_regions, region_view, DominantColorEstimator
+)
+from image_hash import ImageIndex, sha256_hex, dhash, content_path
+from metrics import Metrics, MetricsReporter
+from profiling import Profiler
+
 load_dotenv()
 
 
@@ -83,6 +107,40 @@ class Config:
     thumbnail_size: tuple = (256, 256)
     max_images: Optional[int] = None
     auto_label_threshold: float = 0.7
+    # Pipelined mode: worker threads per stage and bounded queue size between stages
+    pipelined: bool = False
+    decode_workers: int = 1
+    encode_workers: int = 2
+    upload_workers: int = 8
+    insert_workers: int = 1
+    queue_size: int = 64
+    # Checkpoint journal (local SQLite); resume skips offsets already committed
+    journal_path: Optional[str] = None
+    resume: bool = False
+    # Stride sharding: this process handles stream offsets where offset % num_shards == shard_index
+    num_shards: int = 1
+    shard_index: int = 0
+    # Longest side after decode; JPEGs are draft-decoded at the nearest DCT scale
+    max_size: Optional[int] = None
+    # Content-hash dedup index (local SQLite); storage paths become hash-keyed
+    dedup_index: Optional[str] = None
+    dedup_distance: int = 0
+    # Landmark (FaceMesh) regions when MediaPipe is installed; rectangles otherwise
+    landmarks: bool = True
+    # Dominant color of a region: "mean", "histogram" (trimmed mode) or "kmeans"
+    color_estimator: str = "mean"
+    # Longest side auto-labelling analyzes (None = full resolution); <= thumbnail side reuses the thumbnail
+    analysis_size: Optional[int] = None
+    # Metrics (metrics.py), off unless one is set: JSON summary every metrics_interval
+    # seconds, Prometheus /metrics on localhost:metrics_port, text dump to metrics_file
+    # (every metrics_interval, 10 s if unset)
+    metrics_interval: float = 0.0
+    metrics_port: Optional[int] = None
+    metrics_file: Optional[str] = None
+    
+    @property
+    def metrics(self) -> bool:
+        return bool(self.metrics_interval or self.metrics_file) or self.metrics_port is not None
 
 
 # =============================================================================
@@ -90,29 +148,60 @@ class Config:
 # =============================================================================
 
 class Database:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, client: Optional[Client] = None):
         self.config = config
-        self.client: Client = create_client(config.supabase_url, config.supabase_key)
+        # Pass a fake client to exercise ingestion without a Supabase project
+        self.client: Client = client or create_client(config.supabase_url, config.supabase_key)
     
-    def upload_image(self, image: Image.Image, filename: str, folder: str = "celeba-hq") -> str:
+    def encode_image(self, image: Image.Image, quality: int = 95) -> bytes:
         buffer = io.BytesIO()
-        image.save(buffer, format="JPEG", quality=95)
-        buffer.seek(0)
+        image.save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+    
+    def upload_bytes(self, data: bytes, filename: str, folder: str = "celeba-hq") -> str:
         path = f"{folder}/{filename}"
+        # upsert so a re-run after a crash overwrites instead of failing on the path
         self.client.storage.from_(self.config.storage_bucket).upload(
-            path, buffer.getvalue(), {"content-type": "image/jpeg"}
+            path, data, {"content-type": "image/jpeg", "upsert": "true"}
         )
         return path
     
-    def create_thumbnail(self, image: Image.Image) -> Image.Image:
-        thumb = image.copy()
-        thumb.thumbnail(self.config.thumbnail_size, Image.Resampling.LANCZOS)
+    def upload_image(self, image: Image.Image, filename: str, folder: str = "celeba-hq") -> str:
+        return self.upload_bytes(self.encode_image(image), filename, folder)
+    
+    def create_thumbnail(
+        self, image: Image.Image, jpeg_bytes: Optional[bytes] = None, size: Optional[tuple] = None
+    ) -> Image.Image:
+        """
+        Thumbnail (default config.thumbnail_size) without a full-resolution LANCZOS pass.
+        
+        Given the image's own JPEG encoding, `draft` decodes it straight at
+        1/2, 1/4 or 1/8 scale in the DCT domain. Otherwise `reduce` box-filters
+        by the largest whole factor first. LANCZOS only covers the last < 2x.
+        """
+        tw, th = size or self.config.thumbnail_size
+        if jpeg_bytes is not None:
+            thumb = Image.open(io.BytesIO(jpeg_bytes))
+            thumb.draft("RGB", (tw, th))
+        else:
+            factor = min(image.width // tw, image.height // th)
+            thumb = image.reduce(factor) if factor > 1 else image.copy()
+        thumb.thumbnail((tw, th), Image.Resampling.LANCZOS)
         return thumb
     
     def insert_face_images(self, images: List[Dict]) -> List[Dict]:
         result = self.client.table("face_images").insert(images).execute()
         return result.data
     
+    def upsert_face_images(self, images: List[Dict]) -> List[Dict]:
+        """
+        Insert face_images rows; a row whose (source, source_id) already exists
+        is overwritten with the new values (PostgREST merge-duplicates), keeping
+        its id. Returns every row, so a resumed batch gets the original ids.
+        """
+        result = self.client.table("face_images").upsert(images, on_conflict="source,source_id").execute()
+        return result.data
+    
     def create_label(self, face_image_id: str, data: Dict = None) -> Dict:
         record = {"face_image_id": face_image_id, "label_status": "unlabeled"}
         if data:
@@ -120,11 +209,108 @@ class Database:
         result = self.client.table("color_labels").insert(record).execute()
         return result.data[0] if result.data else None
     
+    def create_labels(self, records: List[Dict]) -> List[Dict]:
+        """Insert many color_labels rows in one request."""
+        if not records:
+            return []
+        result = self.client.table("color_labels").insert(records).execute()
+        return result.data
+    
+    def upsert_labels(self, records: List[Dict], ignore_duplicates: bool = False) -> List[Dict]:
+        """
+        Insert or overwrite color_labels rows by face_image_id in one request.
+        With ignore_duplicates, existing rows (and any human labels) are left alone.
+        """
+        if not records:
+            return []
+        result = self.client.table("color_labels").upsert(
+            records, on_conflict="face_image_id", ignore_duplicates=ignore_duplicates
+        ).execute()
+        return result.data
+    
     def update_label(self, face_image_id: str, data: Dict) -> Dict:
         data["labeled_at"] = datetime.utcnow().isoformat()
         result = self.client.table("color_labels").update(data).eq("face_image_id", face_image_id).execute()
         return result.data[0] if result.data else None
     
+    def update_labels(self, records: List[Dict]) -> List[Dict]:
+        """
+        Bulk update_label. Each record carries its face_image_id; records
+        should share the same keys, since PostgREST writes the union of keys.
+        """
+        labeled_at = datetime.utcnow().isoformat()
+        return self.upsert_labels([{**record, "labeled_at": labeled_at} for record in records])
+    
+    def update_labels_if(self, records: List[Dict], statuses: List[str], chunk: int = 100) -> List[Dict]:
+        """
+        update_labels for the records whose label still has one of `statuses`
+        (e.g. not labeled by a reviewer since it was read); the status is
+        re-read just before the write. Returns the records written.
+        """
+        current = set()
+        for start in range(0, len(records), chunk):
+            ids = [record["face_image_id"] for record in records[start:start + chunk]]
+            rows = (
+                self.client.table("color_labels")
+                .select("face_image_id")
+                .in_("face_image_id", ids)
+                .in_("label_status", statuses)
+                .execute().data
+            )
+            current.update(row["face_image_id"] for row in rows)
+        records = [record for record in records if record["face_image_id"] in current]
+        self.update_labels(records)
+        return records
+    
+    def iter_label_rows(self, statuses: List[str], page_size: int = 1000) -> Iterator[Dict]:
+        """
+        face_images rows (id, storage_path, thumbnail_path) whose label has one
+        of `statuses`. Keyset-paged by id, so rows relabeled meanwhile don't
+        shift later pages.
+        """
+        after = None
+        while True:
+            query = (
+                self.client.table("face_images")
+                .select("id, storage_path, thumbnail_path, color_labels!inner(label_status)")
+                .in_("color_labels.label_status", statuses)
+                .order("id")
+                .limit(page_size)
+            )
+            if after is not None:
+                query = query.gt("id", after)
+            rows = query.execute().data
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1]["id"]
+    
+    def iter_color_hexes(self, missing_only: bool = True, page_size: int = 1000) -> Iterator[Dict]:
+        """
+        color_labels rows (face_image_id, eye/hair hex and color name),
+        keyset-paged by face_image_id; with missing_only, just rows lacking a name.
+        """
+        after = None
+        while True:
+            query = (
+                self.client.table("color_labels")
+                .select("face_image_id, eye_hex, eye_color_name, hair_hex, hair_color_name")
+                .order("face_image_id")
+                .limit(page_size)
+            )
+            if missing_only:
+                query = query.or_("eye_color_name.is.null,hair_color_name.is.null")
+            if after is not None:
+                query = query.gt("face_image_id", after)
+            rows = query.execute().data
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1]["face_image_id"]
+    
+    def download_bytes(self, path: str) -> bytes:
+        return self.client.storage.from_(self.config.storage_bucket).download(path)
+    
     def get_stats(self) -> Dict:
         result = self.client.table("v_dataset_stats").select("*").execute()
         return result.data[0] if result.data else {}
@@ -139,16 +325,12 @@ class Database:
 # =============================================================================
 
 class ColorAnalyzer:
-    def __init__(self):
-        self.has_mediapipe = False
-        try:
-            import mediapipe as mp
-            self.mp_face_mesh = mp.solutions.face_mesh
-            self.face_mesh = self.mp_face_mesh.FaceMesh(
-                static_image_mode=True, max_num_faces=1, min_detection_confidence=0.5
-            )
-            self.has_mediapipe = True
-        except ImportError:
+    def __init__(self, use_landmarks: bool = True, estimator: str = "mean"):
+        self.estimator = DominantColorEstimator(estimator)
+        # One FaceMesh per process, shared by every analyzer (and pipeline thread)
+        self.face_mesh = get_face_mesh() if use_landmarks else None
+        self.has_mediapipe = self.face_mesh is not None
+        if use_landmarks and not self.has_mediapipe:
             print("MediaPipe not available, using fallback color extraction")
     
     def extract(self, image: Image.Image) -> Dict:
@@ -156,13 +338,20 @@ class ColorAnalyzer:
         h, w = img.shape[:2]
         
         # Skin: center face region
-        skin_region = img[int(h*0.3):int(h*0.6), int(w*0.3):int(w*0.7)]
-        skin_rgb = np.mean(skin_region.reshape(-1, 3), axis=0).astype(int)
-        skin_hex = '#{:02x}{:02x}{:02x}'.format(*skin_rgb[:3])
+        skin_region = img[int(h*0.3):int(h*0.6), int(w*0.3):int(w*0.7), :3]
+        skin_rgb = np.array(self.estimator(skin_region))
         
         # Hair: top region
-        hair_region = img[0:int(h*0.15), int(w*0.25):int(w*0.75)]
-        hair_rgb = np.mean(hair_region.reshape(-1, 3), axis=0).astype(int)
+        hair_region = img[0:int(h*0.15), int(w*0.25):int(w*0.75), :3]
+        hair_rgb = np.array(self.estimator(hair_region))
+        
+        # Cheeks + forehead and the band above the hairline, where a face is found
+        regions = self.regions(img)
+        if regions:
+            skin_rgb = self._masked(img, regions["skin"], skin_rgb)
+            hair_rgb = self._masked(img, regions["hair"], hair_rgb)
+        
+        skin_hex = '#{:02x}{:02x}{:02x}'.format(*skin_rgb[:3])
         hair_hex = '#{:02x}{:02x}{:02x}'.format(*hair_rgb[:3])
         
         return {
@@ -172,6 +361,58 @@ class ColorAnalyzer:
             "hair_rgb": list(map(int, hair_rgb[:3])),
         }
     
+    def extract_batch(self, images) -> Dict[str, np.ndarray]:
+        """
+        Vectorized extract + analyze_* for N same-size images in one pass.
+        
+        `images` is an N x H x W x 3 uint8 array or a list of same-size PIL
+        images. Returns columnar arrays; row i matches the scalar methods on image i.
+        """
+        stack = stack_images(images)
+        
+        skin_rgb = self.estimator.batch(region_view(stack, (0.3, 0.6), (0.3, 0.7)))
+        hair_rgb = self.estimator.batch(region_view(stack, (0.0, 0.15), (0.25, 0.75)))
+        
+        # Landmark inference is per image; the rectangle means above stay the fallback
+        if self.has_mediapipe:
+            for i in range(len(stack)):
+                regions = self.regions(stack[i])
+                if regions:
+                    skin_rgb[i] = self._masked(stack[i], regions["skin"], skin_rgb[i])
+                    hair_rgb[i] = self._masked(stack[i], regions["hair"], hair_rgb[i])
+        
+        warmth = batch_warmth(skin_rgb)
+        luminance = batch_luminance(skin_rgb)
+        contrast_val = np.abs(luminance - batch_luminance(hair_rgb))
+        
+        return {
+            "skin_rgb": skin_rgb,
+            "hair_rgb": hair_rgb,
+            "warmth": warmth,
+            "undertone": np.select([warmth > 0.1, warmth < -0.05], ["warm", "cool"], "neutral"),
+            "undertone_confidence": np.minimum(np.abs(warmth) * 2, 1.0),
+            "luminance": luminance,
+            "depth": bin_labels(
+                luminance, [0.75, 0.6, 0.45, 0.3],
+                ["light", "light-medium", "medium", "medium-deep", "deep"]
+            ),
+            "contrast_level": bin_labels(
+                contrast_val, [0.5, 0.35, 0.2, 0.1],
+                ["high", "medium-high", "medium", "low-medium", "low"]
+            ),
+            "contrast_value": contrast_val,
+        }
+    
+    def regions(self, img: np.ndarray) -> Optional[Dict[str, np.ndarray]]:
+        """Landmark region masks, or None without MediaPipe or a detected face."""
+        if not self.has_mediapipe:
+            return None
+        landmarks = detect_landmarks(img[..., :3])
+        return face_regions(landmarks, img.shape[:2]) if landmarks is not None else None
+    
+    def _masked(self, img: np.ndarray, mask: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+        return np.array(self.estimator(img[..., :3][mask])) if mask.any() else fallback
+    
     def analyze_undertone(self, skin_rgb: List[int]) -> Dict:
         r, g, b = skin_rgb
         warmth = (r - b) / 255.0
@@ -226,6 +467,7 @@ class ColorAnalyzer:
 class Predictor:
     def __init__(self):
         self.subtypes = SUBTYPES
+        self.compiled = CompiledPredictor(self.subtypes)
     
     def predict(self, undertone: str, depth: str, contrast: str, confidence: float = 1.0) -> Dict:
         scores = {}
@@ -264,6 +506,11 @@ class Predictor:
             "alternatives": [{"subtype": s[0], "confidence": round(s[1], 3)} for s in sorted_scores[1:5]]
         }
     
+    def predict_batch(self, undertones, depths, contrasts, confidences=None) -> List[Dict]:
+        """predict() for whole columns via the compiled lookup tables."""
+        result = self.compiled.predict_batch(undertones, depths, contrasts, confidences)
+        return self.compiled.to_dicts(result)
+    
     def _compatible_undertone(self, expected: str, actual: str) -> bool:
         compat = {
             "warm": ["warm-neutral"], "cool": ["cool-neutral"], "neutral": ["warm-neutral", "cool-neutral"],
@@ -278,64 +525,466 @@ class Predictor:
             return False
 
 
+def label_records(features: Dict[str, np.ndarray], predictor: Predictor, threshold: float) -> List[Dict]:
+    """color_labels fields for every row of ColorAnalyzer.extract_batch output."""
+    predictions = predictor.predict_batch(
+        features["undertone"], features["depth"], features["contrast_level"], features["undertone_confidence"]
+    )
+    columns = {key: values.tolist() for key, values in features.items()}
+    
+    labels = []
+    for row, prediction in enumerate(predictions):
+        skin_rgb, hair_rgb = columns["skin_rgb"][row], columns["hair_rgb"][row]
+        labels.append({
+            "skin_hex": '#{:02x}{:02x}{:02x}'.format(*skin_rgb),
+            "skin_rgb": skin_rgb,
+            "hair_hex": '#{:02x}{:02x}{:02x}'.format(*hair_rgb),
+            "hair_rgb": hair_rgb,
+            "undertone": columns["undertone"][row],
+            "undertone_confidence": columns["undertone_confidence"][row],
+            "depth": columns["depth"][row],
+            "depth_value": columns["luminance"][row],
+            "contrast_level": columns["contrast_level"][row],
+            "contrast_value": columns["contrast_value"][row],
+            "ai_predicted_subtype": prediction["subtype"],
+            "ai_confidence": prediction["confidence"],
+            "ai_alternatives": prediction["alternatives"],
+            "label_status": "ai_predicted" if prediction["confidence"] >= threshold else "needs_review"
+        })
+    return labels
+
+
+# =============================================================================
+# DATASET SOURCES
+# =============================================================================
+
+class DatasetSource:
+    """
+    Ordered stream of raw samples, each {"image": PIL image or {"bytes", "path"}}.
+    
+    `name` keys the checkpoint journal, `source_type` is the face_images.source
+    value and `folder` the storage prefix. iter_from(start, step) yields the
+    samples at offsets start, start + step, ... without decoding any others.
+    """
+    
+    name = ""
+    source_type = "celeba_hq"
+    folder = "celeba-hq"
+    
+    def iter_from(self, start: int = 0, step: int = 1) -> Iterator[Dict]:
+        raise NotImplementedError
+
+
+class HuggingFaceSource(DatasetSource):
+    """A streamed HuggingFace dataset with an `image` column."""
+    
+    def __init__(self, dataset: str = "huggan/CelebA-HQ", split: str = "train",
+                 source_type: str = "celeba_hq", folder: str = "celeba-hq"):
+        self.dataset = dataset
+        self.split = split
+        self.name = f"{dataset}:{split}"
+        self.source_type = source_type
+        self.folder = folder
+    
+    def iter_from(self, start: int = 0, step: int = 1) -> Iterator[Dict]:
+        from datasets import load_dataset, Image as ImageFeature
+        
+        print(f"Loading {self.dataset} dataset...")
+        dataset = load_dataset(self.dataset, split=self.split, streaming=True)
+        # Keep the encoded bytes: skipped samples are never decoded, _decode opens the rest
+        dataset = dataset.cast_column("image", ImageFeature(decode=False))
+        # A stream can't seek, so other shards' samples are still read (undecoded)
+        return itertools.islice(dataset.skip(start) if start else dataset, 0, None, step)
+
+
+class LocalImageSource(DatasetSource):
+    """
+    Image folder or .zip archive on local disk (FFHQ, LFW, CelebA...); no network.
+    
+    Files are listed once in sorted order, so offsets are stable and skipping
+    is a list slice. Loose files are memory-mapped; stored zip members are
+    sliced out of a single mapping of the archive. A background reader maps
+    up to `prefetch` files ahead and asks the kernel to page them in, so
+    decode workers find the bytes already in memory.
+    """
+    
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+    
+    def __init__(self, path: str, source_type: str = "ffhq", folder: Optional[str] = None, prefetch: int = 64):
+        self.path = path
+        self.name = f"local:{os.path.abspath(path)}"
+        self.source_type = source_type
+        self.folder = folder or source_type.replace("_", "-")
+        self.prefetch = prefetch
+    
+    def _is_zip(self) -> bool:
+        return os.path.isfile(self.path) and zipfile.is_zipfile(self.path)
+    
+    def _listing(self) -> List[str]:
+        if self._is_zip():
+            with zipfile.ZipFile(self.path) as archive:
+                names = [n for n in archive.namelist() if n.lower().endswith(self.EXTENSIONS)]
+        else:
+            names = [
+                os.path.relpath(os.path.join(root, f), self.path)
+                for root, _, files in os.walk(self.path)
+                for f in files if f.lower().endswith(self.EXTENSIONS)
+            ]
+        return sorted(names)
+    
+    def iter_from(self, start: int = 0, step: int = 1) -> Iterator[Dict]:
+        names = self._listing()[start::step]
+        ahead: queue.Queue = queue.Queue(self.prefetch)
+        stop = threading.Event()
+        done = object()
+        
+        def reader():
+            try:
+                read = self._zip_reader if self._is_zip() else self._file_reader
+                for sample in read(names):
+                    if stop.is_set():
+                        break
+                    ahead.put(sample)
+            except BaseException as e:
+                ahead.put(e)
+            finally:
+                ahead.put(done)
+        
+        thread = threading.Thread(target=reader, name="prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ahead.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Unblock the reader if the consumer stopped early (max_images, errors)
+            stop.set()
+            while thread.is_alive():
+                try:
+                    ahead.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+    
+    def _file_reader(self, names: List[str]) -> Iterator[Dict]:
+        for name in names:
+            with open(os.path.join(self.path, name), "rb") as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # empty file: a sample with no image
+                    yield {"image": None}
+                    continue
+            if hasattr(data, "madvise"):
+                data.madvise(mmap.MADV_WILLNEED)
+            yield {"image": {"bytes": data, "path": name}}
+    
+    def _zip_reader(self, names: List[str]) -> Iterator[Dict]:
+        with open(self.path, "rb") as f, zipfile.ZipFile(f) as archive:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for name in names:
+                    info = archive.getinfo(name)
+                    if not info.file_size:
+                        yield {"image": None}
+                    elif info.compress_type != zipfile.ZIP_STORED:
+                        yield {"image": {"bytes": archive.read(info), "path": name}}
+                    else:
+                        # Local file header: 30 bytes, then file name and extra field
+                        header = info.header_offset
+                        name_len, extra_len = struct.unpack("<HH", mapped[header + 26:header + 30])
+                        offset = header + 30 + name_len + extra_len
+                        yield {"image": {"bytes": mapped[offset:offset + info.compress_size], "path": name}}
+            finally:
+                mapped.close()
+
+
+# =============================================================================
+# CHECKPOINT JOURNAL
+# =============================================================================
+
+class IngestJournal:
+    """
+    Local SQLite record of which stream offsets are safely in the database.
+    
+    An offset is marked "done" once its face_images and color_labels rows
+    are committed, or "skipped" if the sample had no image. Batches are
+    logged as "inserting" before their DB writes and "committed" after, so
+    a crash leaves an honest trail. Pipelined runs commit out of order, so
+    resume_point() returns the first gap plus the committed offsets past it.
+    Offsets are global stream positions, so shards of any layout can share
+    one journal file and resume from it.
+    """
+    
+    def __init__(self, path: str, stream: str):
+        self.stream = stream
+        self.lock = threading.Lock()
+        # Worker processes share the file; wait on their write locks instead of failing
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS offsets (
+                stream TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                batch_id INTEGER,
+                PRIMARY KEY (stream, offset)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stream TEXT NOT NULL,
+                status TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                first_offset INTEGER,
+                last_offset INTEGER,
+                started_at TEXT,
+                finished_at TEXT
+            );
+        """)
+        self.conn.commit()
+    
+    def begin_batch(self, offsets: List[int]) -> int:
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO batches (stream, status, size, first_offset, last_offset, started_at) "
+                "VALUES (?, 'inserting', ?, ?, ?, ?)",
+                (self.stream, len(offsets), min(offsets), max(offsets), datetime.utcnow().isoformat()),
+            )
+            return cursor.lastrowid
+    
+    def commit_batch(self, batch_id: int, offsets: List[int]):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO offsets (stream, offset, status, batch_id) VALUES (?, ?, 'done', ?)",
+                [(self.stream, offset, batch_id) for offset in offsets],
+            )
+            self.conn.execute(
+                "UPDATE batches SET status = 'committed', finished_at = ? WHERE id = ?",
+                (datetime.utcnow().isoformat(), batch_id),
+            )
+    
+    def mark_skipped(self, offset: int):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO offsets (stream, offset, status) VALUES (?, ?, 'skipped')",
+                (self.stream, offset),
+            )
+    
+    def interrupted_batches(self) -> int:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM batches WHERE stream = ? AND status != 'committed'", (self.stream,)
+            ).fetchone()
+        return row[0]
+    
+    def resume_point(self, num_shards: int = 1, shard_index: int = 0):
+        """
+        For one shard: (first uncommitted offset, {offset: status} past it,
+        images done before it).
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT offset, status FROM offsets WHERE stream = ? AND offset % ? = ? ORDER BY offset",
+                (self.stream, num_shards, shard_index),
+            ).fetchall()
+        
+        start, done = shard_index, 0
+        for offset, status in rows:
+            if offset != start:
+                break
+            start += num_shards
+            done += status == "done"
+        return start, {offset: status for offset, status in rows if offset >= start}, done
+    
+    def close(self):
+        self.conn.close()
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+class Pipeline:
+    """
+    Worker pools joined by bounded queues.
+    
+    Each stage takes items from its input queue, applies its function and
+    passes the result on; returning None drops the item. A full queue blocks
+    the stage feeding it, so slow uploads throttle decoding instead of
+    buffering the dataset in memory. The first exception stops the source,
+    drains in-flight items and is re-raised from run().
+    """
+    
+    _DONE = object()
+    
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = queue_size
+        self.stages = []
+        self.queues: List[queue.Queue] = []
+        self._error: Optional[BaseException] = None
+        self._stop = threading.Event()
+    
+    def add_stage(self, name: str, fn: Callable, workers: int = 1) -> "Pipeline":
+        self.stages.append((name, fn, max(1, workers)))
+        return self
+    
+    def depths(self) -> Dict[str, int]:
+        """Items waiting for each stage (and for the sink), while running."""
+        names = [name for name, _, _ in self.stages] + ["sink"]
+        return {name: q.qsize() for name, q in zip(names, self.queues)}
+    
+    def run(self, source: Iterable, sink: Callable) -> None:
+        """Feed `source` through every stage and call `sink` on the main thread."""
+        queues = self.queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), name="source", daemon=True)]
+        
+        for i, (name, fn, workers) in enumerate(self.stages):
+            live = [workers]
+            lock = threading.Lock()
+            for n in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(fn, queues[i], queues[i + 1], live, lock),
+                    name=f"{name}-{n}", daemon=True,
+                ))
+        
+        for thread in threads:
+            thread.start()
+        
+        while True:
+            item = queues[-1].get()
+            if item is self._DONE:
+                break
+            if self._stop.is_set():
+                continue
+            try:
+                sink(item)
+            except BaseException as e:
+                self._fail(e)
+        
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+    
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+    
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+    
+    def _feed(self, source: Iterable, outbox: queue.Queue):
+        try:
+            for item in source:
+                if self._stop.is_set():
+                    break
+                outbox.put(item)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            outbox.put(self._DONE)
+    
+    def _work(self, fn: Callable, inbox: queue.Queue, outbox: queue.Queue, live: List[int], lock):
+        while True:
+            item = inbox.get()
+            if item is self._DONE:
+                inbox.put(item)  # let sibling workers see it too
+                with lock:
+                    live[0] -= 1
+                    last = live[0] == 0
+                if last:
+                    outbox.put(self._DONE)
+                return
+            if self._stop.is_set():
+                continue
+            try:
+                result = fn(item)
+            except BaseException as e:
+                self._fail(e)
+                continue
+            if result is not None:
+                outbox.put(result)
+
+
 # =============================================================================
 # INGESTION
 # =============================================================================
 
+# Timed per call when metrics are on; "source" (the dataset iterator) is timed too
+INGEST_STAGES = ["_decode", "_encode", "_upload", "_process_batch", "_auto_label_batch"]
+
+
 class Ingestion:
-    def __init__(self, db: Database, config: Config):
+    def __init__(self, db: Database, config: Config, source: Optional[DatasetSource] = None):
         self.db = db
         self.config = config
-        self.analyzer = ColorAnalyzer()
+        self.source = source or HuggingFaceSource()
+        self.analyzer = ColorAnalyzer(use_landmarks=config.landmarks, estimator=config.color_estimator)
         self.predictor = Predictor()
+        self.journal = IngestJournal(config.journal_path, self.source.name) if config.journal_path else None
+        self.index = ImageIndex(config.dedup_index) if config.dedup_index else None
+        self._pipeline: Optional[Pipeline] = None
+        self._pending: deque = deque()
+        # Upload outcomes of this run's samples; duplicates don't count toward max_images
+        self._outcomes = threading.Condition()
+        self._uploaded = 0
+        self._duplicates = 0
+        self.metrics = self._instrument() if config.metrics else None
+    
+    def _instrument(self) -> Metrics:
+        """Time every stage and Database call (wrapping these instances only) and expose queue depths."""
+        labels = {"shard": str(self.config.shard_index)} if self.config.num_shards > 1 else None
+        metrics = Metrics("ingest", labels)
+        self._stage_seconds = metrics.histogram("stage_seconds", "stage", "Seconds per call of each ingestion stage")
+        metrics.instrument(self, INGEST_STAGES, self._stage_seconds)
+        db_methods = [name for name in vars(Database) if not name.startswith("_") and callable(getattr(Database, name))]
+        metrics.instrument(self.db, db_methods, metrics.histogram("db_seconds", "method", "Seconds per Database call"))
+        metrics.gauge("queue_depth", "queue", "Items waiting for each pipelined stage", self._queue_depths)
+        return metrics
+    
+    def _queue_depths(self) -> Dict[str, int]:
+        if self._pipeline is None:
+            return {}
+        return {**self._pipeline.depths(), "insert": len(self._pending)}
     
     def run(self, auto_label: bool = False):
-        from datasets import load_dataset
+        if self.metrics is None:
+            return self._run(auto_label)
+        interval = self.config.metrics_interval or (10.0 if self.config.metrics_file else 0.0)
+        with MetricsReporter(
+            self.metrics, interval, self.config.metrics_port, self.config.metrics_file, log=tqdm.write
+        ):
+            return self._run(auto_label)
+    
+    def _run(self, auto_label: bool):
+        self._uploaded = self._duplicates = 0
+        start, committed, done = self.config.shard_index, {}, 0
+        if self.config.resume and self.journal:
+            start, committed, done = self.journal.resume_point(self.config.num_shards, self.config.shard_index)
+            interrupted = self.journal.interrupted_batches()
+            print(f"Resuming at offset {start}: {done + sum(s == 'done' for s in committed.values())} "
+                  f"images already ingested, {interrupted} interrupted batches will be redone")
         
-        print("Loading CelebA-HQ dataset...")
-        dataset = load_dataset("huggan/CelebA-HQ", split="train", streaming=True)
+        dataset = self.source.iter_from(start, self.config.num_shards)
+        if self.metrics:
+            dataset = self.metrics.timed_iter(dataset, self._stage_seconds, "source")
+        samples = self._samples(dataset, start, committed, done)
+        if self.config.pipelined:
+            return self._run_pipelined(samples, auto_label)
         
         batch = []
         processed = 0
         pbar = tqdm(desc="Ingesting", unit="images")
         
         try:
-            for sample in dataset:
-                if self.config.max_images and processed >= self.config.max_images:
-                    break
-                
-                image = sample["image"]
-                if not isinstance(image, Image.Image):
+            for item in samples:
+                entry = self._upload(self._encode(self._decode(item)), auto_label)
+                if entry is None:
                     continue
-                if image.mode != "RGB":
-                    image = image.convert("RGB")
-                
-                source_id = f"{processed:06d}"
-                filename = f"{source_id}.jpg"
-                thumb_filename = f"{source_id}_thumb.jpg"
-                
-                # Upload
-                storage_path = self.db.upload_image(image, filename)
-                thumbnail = self.db.create_thumbnail(image)
-                thumb_path = self.db.upload_image(thumbnail, thumb_filename, "celeba-hq/thumbnails")
-                
-                # File size
-                buf = io.BytesIO()
-                image.save(buf, format="JPEG", quality=95)
-                
-                batch.append({
-                    "record": {
-                        "source": "celeba_hq",
-                        "source_id": source_id,
-                        "storage_path": storage_path,
-                        "thumbnail_path": thumb_path,
-                        "width": image.width,
-                        "height": image.height,
-                        "file_size_bytes": buf.tell(),
-                        "is_processed": auto_label
-                    },
-                    "image": image if auto_label else None
-                })
+                batch.append(entry)
                 
                 processed += 1
                 pbar.update(1)
@@ -350,18 +999,286 @@ class Ingestion:
             pbar.close()
         
         print(f"\nDone! Processed {processed} images.")
+        if self.index is not None:
+            print(f"Skipped {self._duplicates} duplicates (not counted toward --max-images)")
+        if auto_label:
+            print(f"Color estimator: {self.analyzer.estimator.stats()}")
+        return processed
+    
+    def _run_pipelined(self, samples: Iterable[Dict], auto_label: bool) -> int:
+        """
+        Decode -> encode -> upload on worker pools, DB inserts in batches.
+        
+        Batches are formed in completion order, so rows within a batch are
+        not sorted by source_id. At most `insert_workers` batches are in
+        flight; waiting on the oldest one is what backs up the upload queue.
+        """
+        pipeline = self._pipeline = (
+            Pipeline(self.config.queue_size)
+            .add_stage("decode", self._decode, self.config.decode_workers)
+            .add_stage("encode", self._encode, self.config.encode_workers)
+            .add_stage("upload", lambda item: self._upload(item, auto_label), self.config.upload_workers)
+        )
+        
+        batch = []
+        processed = 0
+        pending = self._pending = deque()
+        pbar = tqdm(desc="Ingesting", unit="images")
+        
+        with ThreadPoolExecutor(self.config.insert_workers, thread_name_prefix="insert") as inserts:
+            def flush():
+                nonlocal batch
+                pending.append(inserts.submit(self._process_batch, batch, auto_label))
+                batch = []
+                while len(pending) > self.config.insert_workers:
+                    pending.popleft().result()
+            
+            def sink(entry: Dict):
+                nonlocal processed
+                batch.append(entry)
+                processed += 1
+                pbar.update(1)
+                if len(batch) >= self.config.batch_size:
+                    flush()
+            
+            try:
+                pipeline.run(samples, sink)
+            finally:
+                if batch:
+                    flush()
+                while pending:
+                    pending.popleft().result()
+                pbar.close()
+        
+        print(f"\nDone! Processed {processed} images.")
+        if self.index is not None:
+            print(f"Skipped {self._duplicates} duplicates (not counted toward --max-images)")
+        if auto_label:
+            print(f"Color estimator: {self.analyzer.estimator.stats()}")
         return processed
     
+    def _samples(
+        self,
+        dataset: Iterable[Dict],
+        start: Optional[int] = None,
+        committed: Optional[Dict[int, str]] = None,
+        processed: int = 0,
+    ) -> Iterator[Dict]:
+        """
+        Undecoded image samples keyed by stream offset, honouring max_images.
+        
+        `dataset` holds this shard's samples from offset `start` on, one per
+        `num_shards` offsets. source_id is the global stream offset, so a
+        resumed, repeated or sharded run maps each sample to the same storage
+        paths and face_images row, and shards can never collide. Each shard
+        takes its stride's share of max_images. `processed` counts images
+        already ingested before `start`. Samples skipped as duplicates don't
+        count toward max_images.
+        """
+        committed = committed or {}
+        num_shards, shard_index = self.config.num_shards, self.config.shard_index
+        start = shard_index if start is None else start
+        max_images = self.config.max_images
+        if max_images and num_shards > 1:
+            max_images = len(range(shard_index, max_images, num_shards))
+        
+        yielded = 0
+        for offset, sample in zip(itertools.count(start, num_shards), dataset):
+            if max_images and self._cap_reached(processed, yielded, max_images):
+                break
+            
+            status = committed.get(offset)
+            if status is not None:
+                processed += status == "done"
+                continue
+            
+            image = sample["image"]
+            has_image = isinstance(image, Image.Image) or (
+                isinstance(image, dict) and bool(image.get("bytes") or image.get("path"))
+            )
+            if not has_image:
+                if self.journal:
+                    self.journal.mark_skipped(offset)
+                continue
+            
+            yield {"offset": offset, "source_id": f"{offset:06d}", "image": image}
+            processed += 1
+            yielded += 1
+    
+    def _cap_reached(self, processed: int, yielded: int, max_images: int) -> bool:
+        """
+        Whether max_images new images are ingested. Pipelined, samples may still
+        be in flight: wait for their upload outcomes, since a duplicate frees its slot.
+        """
+        with self._outcomes:
+            while processed - self._duplicates >= max_images:
+                if self._uploaded + self._duplicates >= yielded:
+                    return True
+                if self._pipeline is not None and self._pipeline.stopping:
+                    return True
+                self._outcomes.wait(0.1)
+            return False
+    
+    def _outcome(self, duplicate: bool):
+        with self._outcomes:
+            if duplicate:
+                self._duplicates += 1
+            else:
+                self._uploaded += 1
+            self._outcomes.notify_all()
+    
+    def _decode(self, item: Dict) -> Dict:
+        image = item["image"]
+        if isinstance(image, dict):
+            data = image.get("bytes")
+            if isinstance(data, mmap.mmap):
+                image = Image.open(data)
+            else:
+                image = Image.open(io.BytesIO(data) if data else image["path"])
+        
+        max_size = self.config.max_size
+        if max_size:
+            image.draft("RGB", (max_size, max_size))  # no-op unless JPEG and not yet loaded
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.load()
+        if max_size and max(image.size) > max_size:
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        item["image"] = image
+        return item
+    
+    def _encode(self, item: Dict) -> Dict:
+        # One full-size encode, reused for the upload, file_size_bytes and the thumbnail
+        image = item["image"]
+        item["image_bytes"] = self.db.encode_image(image)
+        thumbnail = self.db.create_thumbnail(image, item["image_bytes"])
+        item["thumb_bytes"] = self.db.encode_image(thumbnail)
+        item["analysis"] = self._analysis_image(image, thumbnail, item["image_bytes"])
+        if self.index is not None:
+            item["sha256"] = sha256_hex(item["image_bytes"])
+            item["dhash"] = dhash(thumbnail)
+        return item
+    
+    def _analysis_image(self, image: Image.Image, thumbnail: Image.Image, jpeg_bytes: bytes) -> Image.Image:
+        """
+        The image auto-labelling sees: full size, or fit to config.analysis_size.
+        
+        Sizes up to the thumbnail's reuse it (box-reduced if smaller still);
+        larger ones are draft-decoded from the JPEG at the nearest DCT scale.
+        """
+        size = self.config.analysis_size
+        if not size or max(image.size) <= size:
+            return image
+        if size == max(thumbnail.size):
+            return thumbnail
+        if size > max(thumbnail.size):
+            return self.db.create_thumbnail(image, jpeg_bytes, (size, size))
+        factor = max(thumbnail.size) // size
+        small = thumbnail.reduce(factor) if factor > 1 else thumbnail.copy()
+        small.thumbnail((size, size), Image.Resampling.BILINEAR)
+        return small
+    
+    def _upload(self, item: Dict, auto_label: bool) -> Optional[Dict]:
+        """Upload full image and thumbnail; None if the dedup index already has the image."""
+        source_id = item["source_id"]
+        image = item["image"]
+        folder = self.source.folder
+        
+        if self.index is None:
+            storage_path = self.db.upload_bytes(item["image_bytes"], f"{source_id}.jpg", folder)
+            thumb_path = self.db.upload_bytes(item["thumb_bytes"], f"{source_id}_thumb.jpg", f"{folder}/thumbnails")
+        else:
+            sha = item["sha256"]
+            duplicate = self.index.reserve(sha, item["dhash"], self.config.dedup_distance)
+            if duplicate is not None:
+                if self.journal:
+                    self.journal.mark_skipped(item["offset"])
+                self._outcome(duplicate=True)
+                return None
+            try:
+                image_folder, image_name = content_path(folder, sha).rsplit("/", 1)
+                thumb_folder, thumb_name = content_path(f"{folder}/thumbnails", sha, "_thumb.jpg").rsplit("/", 1)
+                storage_path = self.db.upload_bytes(item["image_bytes"], image_name, image_folder)
+                thumb_path = self.db.upload_bytes(item["thumb_bytes"], thumb_name, thumb_folder)
+            except BaseException:
+                self.index.release(sha)
+                raise
+        
+        self._outcome(duplicate=False)
+        return {
+            "record": {
+                "source": self.source.source_type,
+                "source_id": source_id,
+                "storage_path": storage_path,
+                "thumbnail_path": thumb_path,
+                "width": image.width,
+                "height": image.height,
+                "file_size_bytes": len(item["image_bytes"]),
+                "is_processed": auto_label
+            },
+            "image": item["analysis"] if auto_label else None,
+            "offset": item["offset"],
+            "hash": (item["sha256"], item["dhash"]) if self.index is not None else None
+        }
+    
     def _process_batch(self, batch: List[Dict], auto_label: bool):
+        # Two requests per batch: face_images rows, then all their color_labels
+        # Upserts keep a redone batch (crash after insert, before commit) idempotent
         records = [item["record"] for item in batch]
-        results = self.db.insert_face_images(records)
+        offsets = [item["offset"] for item in batch]
+        batch_id = self.journal.begin_batch(offsets) if self.journal else None
         
-        for i, result in enumerate(results):
-            if auto_label and batch[i]["image"]:
-                label_data = self._auto_label(batch[i]["image"])
-                self.db.create_label(result["id"], label_data)
+        try:
+            if auto_label:
+                labels = self._auto_label_batch([item["image"] for item in batch])
             else:
-                self.db.create_label(result["id"])
+                labels = [{} for _ in batch]
+            
+            results = self.db.upsert_face_images(records)
+            ids = {row["source_id"]: row["id"] for row in results}
+            self.db.upsert_labels([
+                {"face_image_id": ids[record["source_id"]], "label_status": "unlabeled", **label}
+                for record, label in zip(records, labels)
+            ], ignore_duplicates=True)
+            
+            if self.journal:
+                self.journal.commit_batch(batch_id, offsets)
+        except BaseException:
+            # Not committed: drop the reservations, or a resumed run would skip these as duplicates
+            if self.index is not None:
+                for item in batch:
+                    self.index.release(item["hash"][0])
+            raise
+        
+        # Only index images whose rows are committed, so a redone batch isn't seen as a duplicate
+        if self.index is not None:
+            for item in batch:
+                sha, image_hash = item["hash"]
+                self.index.add(sha, image_hash, "face", item["record"]["storage_path"])
+    
+    def _auto_label_batch(self, images: List[Image.Image]) -> List[Dict]:
+        """_auto_label for a whole batch: one extract_batch per image size, one predict_batch."""
+        try:
+            groups: Dict[tuple, List[int]] = {}
+            for i, image in enumerate(images):
+                groups.setdefault(image.size, []).append(i)
+            
+            order, parts = [], []
+            for indices in groups.values():
+                parts.append(self.analyzer.extract_batch([images[i] for i in indices]))
+                order.extend(indices)
+            features = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+            
+            rows = label_records(features, self.predictor, self.config.auto_label_threshold)
+        except Exception as e:
+            print(f"Batch auto-label error: {e}; labelling one by one")
+            return [self._auto_label(image) for image in images]
+        
+        labels: List[Optional[Dict]] = [None] * len(images)
+        for row, i in enumerate(order):
+            labels[i] = rows[row]
+        return labels
     
     def _auto_label(self, image: Image.Image) -> Dict:
         try:
@@ -396,6 +1313,51 @@ class Ingestion:
             return {"label_status": "unlabeled"}
 
 
+# =============================================================================
+# MULTI-PROCESS
+# =============================================================================
+
+def _ingest_shard(config: Config, source: DatasetSource, auto_label: bool, profile: Optional[Dict] = None) -> int:
+    """Worker process entry point: its own Supabase client and Ingestion (and profile, PREFIX.shardN.*)."""
+    if profile:
+        profile = dict(profile, prefix=f"{profile['prefix']}.shard{config.shard_index}")
+    with Profiler(**(profile or {})) as profiler:
+        profiler.items = Ingestion(Database(config), config, source).run(auto_label=auto_label)
+    return profiler.items
+
+
+def _worker_metrics(config: Config, i: int) -> Dict:
+    """Worker i's own metrics port (metrics_port + i; 0 stays ephemeral) and file (ingest.i.prom)."""
+    metrics = {}
+    if config.metrics_port:
+        metrics["metrics_port"] = config.metrics_port + i
+    if config.metrics_file:
+        root, ext = os.path.splitext(config.metrics_file)
+        metrics["metrics_file"] = f"{root}.{i}{ext}"
+    return metrics
+
+
+def run_workers(
+    config: Config, source: DatasetSource, workers: int, auto_label: bool, profile: Optional[Dict] = None
+) -> int:
+    """
+    Split this machine's shard across `workers` processes.
+    
+    Worker i takes shard `shard_index + i * num_shards` of `num_shards * workers`,
+    so together they cover exactly the offsets of `--shard-index` and any
+    machine layout can be combined with any per-machine worker count.
+    """
+    configs = [
+        replace(
+            config, num_shards=config.num_shards * workers, shard_index=config.shard_index + i * config.num_shards,
+            **_worker_metrics(config, i)
+        )
+        for i in range(workers)
+    ]
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return sum(pool.map(_ingest_shard, configs, [source] * workers, [auto_label] * workers, [profile] * workers))
+
+
 # =============================================================================
 # MAIN
 # =============================================================================
@@ -406,16 +1368,79 @@ def main():
     parser.add_argument("--batch-size", type=int, default=50)
     parser.add_argument("--auto-label", action="store_true")
     parser.add_argument("--bucket", default="face-images")
+    parser.add_argument("--pipelined", action="store_true", help="Decode/encode/upload on worker pools")
+    parser.add_argument("--decode-workers", type=int, default=1)
+    parser.add_argument("--encode-workers", type=int, default=2)
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--insert-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--journal", default="ingest_journal.sqlite", help="Checkpoint journal path")
+    parser.add_argument("--resume", action="store_true", help="Skip samples the journal marks as ingested")
+    parser.add_argument("--num-shards", type=int, default=1, help="Total shards across all machines")
+    parser.add_argument("--shard-index", type=int, default=0, help="This machine's shard (0-based)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes on this machine")
+    parser.add_argument("--local", help="Ingest from a local image folder or .zip instead of HuggingFace")
+    parser.add_argument("--source-type", choices=["celeba_hq", "ffhq", "training_upload"],
+                        help="face_images.source value (default: celeba_hq, or ffhq with --local)")
+    parser.add_argument("--max-size", type=int, help="Downscale on decode so the longest side fits")
+    parser.add_argument("--prefetch", type=int, default=64, help="Local files read ahead of decode")
+    parser.add_argument("--dedup", metavar="PATH", help="Content-hash index; skip images already ingested")
+    parser.add_argument("--dedup-distance", type=int, default=0,
+                        help="Also skip images whose dHash is within this many bits of a known one")
+    parser.add_argument("--no-landmarks", action="store_true",
+                        help="Fixed rectangles for skin/hair even if MediaPipe is installed")
+    parser.add_argument("--analysis-size", type=int,
+                        help="Auto-label on images fit to this many pixels (e.g. 128) instead of full size")
+    parser.add_argument("--color-estimator", choices=DominantColorEstimator.METHODS, default="mean",
+                        help="Dominant color of a region: plain mean, trimmed histogram mode, or k-means")
+    parser.add_argument("--metrics-interval", type=float, default=0.0,
+                        help="Log a JSON summary of per-stage timings and queue depths every N seconds")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve Prometheus metrics on localhost:PORT/metrics (workers use PORT+i)")
+    parser.add_argument("--metrics-file",
+                        help="Rewrite Prometheus metrics to this file every --metrics-interval (default 10) seconds")
+    parser.add_argument("--profile", metavar="PREFIX",
+                        help="Write PREFIX.pstats (cProfile) and PREFIX.collapsed (sampled stacks, for flamegraphs)")
+    parser.add_argument("--profile-mode", choices=Profiler.MODES, default="both")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Also write PREFIX.alloc.txt: top tracemalloc allocation sites per image")
     args = parser.parse_args()
     
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index must be in [0, --num-shards)")
+    
     config = Config(
         supabase_url=os.getenv("SUPABASE_URL"),
         supabase_key=os.getenv("SUPABASE_KEY"),
         storage_bucket=args.bucket,
         batch_size=args.batch_size,
-        max_images=args.max_images
+        max_images=args.max_images,
+        pipelined=args.pipelined,
+        decode_workers=args.decode_workers,
+        encode_workers=args.encode_workers,
+        upload_workers=args.upload_workers,
+        insert_workers=args.insert_workers,
+        queue_size=args.queue_size,
+        journal_path=args.journal,
+        resume=args.resume,
+        num_shards=args.num_shards,
+        shard_index=args.shard_index,
+        max_size=args.max_size,
+        dedup_index=args.dedup,
+        dedup_distance=args.dedup_distance,
+        landmarks=not args.no_landmarks,
+        color_estimator=args.color_estimator,
+        analysis_size=args.analysis_size,
+        metrics_interval=args.metrics_interval,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file
     )
     
+    if args.local:
+        source = LocalImageSource(args.local, args.source_type or "ffhq", prefetch=args.prefetch)
+    else:
+        source = HuggingFaceSource(source_type=args.source_type or "celeba_hq")
+    
     if not config.supabase_url or not config.supabase_key:
         print("Error: Set SUPABASE_URL and SUPABASE_KEY in .env file")
         return
@@ -423,14 +1448,24 @@ def main():
     print("=" * 60)
     print("STREAMS OF COLOR - CelebA-HQ Ingestion")
     print("=" * 60)
+    print(f"Source: {source.name}")
     print(f"Max images: {args.max_images}")
     print(f"Batch size: {args.batch_size}")
     print(f"Auto-label: {args.auto_label}")
+    if args.pipelined:
+        print(f"Pipelined: decode={args.decode_workers} encode={args.encode_workers} "
+              f"upload={args.upload_workers} insert={args.insert_workers} queue={args.queue_size}")
+    if args.num_shards > 1 or args.workers > 1:
+        print(f"Shard: {args.shard_index} of {args.num_shards}, {args.workers} worker processes")
     print()
     
+    profile = {"prefix": args.profile, "mode": args.profile_mode, "memory": args.profile_memory} if args.profile else None
     db = Database(config)
-    ingestion = Ingestion(db, config)
-    count = ingestion.run(auto_label=args.auto_label)
+    if args.workers > 1:
+        count = run_workers(config, source, args.workers, args.auto_label, profile)
+    else:
+        with Profiler(**(profile or {})) as profiler:
+            count = profiler.items = Ingestion(db, config, source).run(auto_label=args.auto_label)
     
     print("\n" + "=" * 60)
     print("STATISTICS")
@@ -0,0 +1,351 @@
+"""
+STREAMS OF COLOR - Pipeline Metrics
+====================================
+Timers, counters and gauges for ingest.py, exported as Prometheus text.
+
+Nothing here is on the hot path unless metrics are enabled: instrument()
+swaps an object's methods for timed wrappers on that one instance, so an
+uninstrumented Ingestion or Database runs exactly the original code.
+
+Output:
+- a periodic one-line JSON summary per interval: calls/s, busy threads,
+  mean/p50/p99 ms per stage and DB call, current queue depths
+- an optional local /metrics endpoint (Prometheus text format)
+- an optional file dump of the same text, rewritten atomically each interval
+  (node_exporter textfile-collector compatible)
+
+Usage:
+    metrics = Metrics("ingest")
+    stages = metrics.histogram("stage_seconds", "stage", "Seconds per call of each stage")
+    metrics.instrument(ingestion, ["_decode", "_encode"], stages)
+    metrics.gauge("queue_depth", "queue", "Items waiting", pipeline.depths)
+    with MetricsReporter(metrics, interval=10, port=9108, path="ingest.prom"):
+        ingestion.run()
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# Upper bounds (seconds) of the latency buckets; the last bucket is +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# =============================================================================
+# METRIC TYPES
+# =============================================================================
+
+class Counter:
+    """Monotonic totals, one per label value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, label: str, help: str):
+        self.name, self.label, self.help = name, label, help
+        self.values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, key: str, value: float = 1):
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.values)
+
+    def samples(self) -> Iterator[tuple]:
+        for key, value in sorted(self.snapshot().items()):
+            yield "_total", {self.label: key}, value
+
+
+class Gauge:
+    """Values read on demand from `fn() -> {label value: number}` (e.g. queue sizes)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, label: str, help: str, fn: Callable[[], Dict[str, float]]):
+        self.name, self.label, self.help, self.fn = name, label, help, fn
+
+    def snapshot(self) -> Dict[str, float]:
+        try:
+            return dict(self.fn())
+        except Exception:
+            return {}
+
+    def samples(self) -> Iterator[tuple]:
+        for key, value in sorted(self.snapshot().items()):
+            yield "", {self.label: key}, value
+
+
+class Histogram:
+    """Latency histograms (fixed BUCKETS), one per label value, plus an error counter."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, label: str, help: str, errors: Counter):
+        self.name, self.label, self.help = name, label, help
+        self.errors = errors
+        # label value -> [bucket counts..., sum of seconds]
+        self.series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(BUCKETS) + 2)
+            series[i] += 1
+            series[-1] += seconds
+
+    def time(self, key: str, fn: Callable) -> Callable:
+        """`fn` wrapped to record its duration under `key` (and its exceptions as errors)."""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                self.errors.inc(key)
+                raise
+            finally:
+                self.observe(key, time.perf_counter() - start)
+        timed.__wrapped__ = fn
+        return timed
+
+    def snapshot(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self.series.items()}
+
+    def samples(self) -> Iterator[tuple]:
+        for key, series in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), series[:-1]):
+                cumulative += count
+                yield "_bucket", {self.label: key, "le": _format(bound)}, cumulative
+            yield "_sum", {self.label: key}, series[-1]
+            yield "_count", {self.label: key}, cumulative
+
+
+def quantile(counts: List[float], q: float) -> Optional[float]:
+    """Seconds at quantile q of per-bucket counts, interpolated within the bucket (as histogram_quantile does)."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank, cumulative = q * total, 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if i == len(BUCKETS):
+                return BUCKETS[-1]  # +Inf bucket: the highest finite bound
+            lower = BUCKETS[i - 1] if i else 0.0
+            return lower + (BUCKETS[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return BUCKETS[-1]
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# =============================================================================
+# REGISTRY
+# =============================================================================
+
+class Metrics:
+    """All metrics of one process, under `namespace`, with optional constant labels (e.g. shard)."""
+
+    def __init__(self, namespace: str = "ingest", labels: Optional[Dict[str, str]] = None):
+        self.namespace = namespace
+        self.labels = dict(labels or {})
+        self.metrics: List = []
+        self._previous: Dict[str, Dict] = {}
+        self._previous_at = time.perf_counter()
+
+    def counter(self, name: str, label: str, help: str) -> Counter:
+        metric = Counter(name, label, help)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, label: str, help: str, fn: Callable[[], Dict[str, float]]) -> Gauge:
+        metric = Gauge(name, label, help, fn)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, label: str, help: str) -> Histogram:
+        errors = self.counter(name.rsplit("_seconds", 1)[0] + "_errors", label, f"Exceptions raised, by {label}")
+        metric = Histogram(name, label, help, errors)
+        self.metrics.append(metric)
+        return metric
+
+    def instrument(self, obj, methods: Iterable[str], histogram: Histogram) -> None:
+        """Replace each of obj's methods with a timed wrapper, on this instance only."""
+        for name in methods:
+            setattr(obj, name, histogram.time(name.strip("_"), getattr(obj, name)))
+
+    def timed_iter(self, iterable: Iterable, histogram: Histogram, key: str) -> Iterator:
+        """Yield from `iterable`, timing each next() (time spent producing, e.g. a dataset stream)."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            histogram.observe(key, time.perf_counter() - start)
+            yield item
+
+    # -------------------------------------------------------------------------
+    # Output
+    # -------------------------------------------------------------------------
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        constant = "".join(f',{k}="{v}"' for k, v in self.labels.items())
+        lines = []
+        for metric in self.metrics:
+            name = f"{self.namespace}_{metric.name}"
+            lines.append(f"# HELP {name}{'_total' if metric.kind == 'counter' else ''} {metric.help}")
+            lines.append(f"# TYPE {name}{'_total' if metric.kind == 'counter' else ''} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                pairs = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{suffix}{{{pairs}{constant}}} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """render() to `path`, atomically (readers never see a partial file)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def summary(self) -> Dict:
+        """
+        Activity since the previous summary: per label, calls/s, busy threads
+        (seconds spent / seconds elapsed, so a stage at its worker count is
+        saturated), mean/p50/p99 ms and errors; gauges as current values.
+        """
+        now = time.perf_counter()
+        elapsed = max(now - self._previous_at, 1e-9)
+        report = {"time": datetime.now().isoformat(timespec="seconds"), "interval_s": round(elapsed, 2), **self.labels}
+
+        current = {metric.name: metric.snapshot() for metric in self.metrics}
+        for metric in self.metrics:
+            if isinstance(metric, Histogram):
+                errors = current[metric.errors.name]
+                previous_errors = self._previous.get(metric.errors.name, {})
+                section = {}
+                for key, series in current[metric.name].items():
+                    before = self._previous.get(metric.name, {}).get(key, [0] * len(series))
+                    delta = [a - b for a, b in zip(series, before)]
+                    calls = sum(delta[:-1])
+                    if not calls:
+                        continue
+                    p50, p99 = quantile(delta[:-1], 0.5), quantile(delta[:-1], 0.99)
+                    section[key] = {
+                        "calls": calls,
+                        "per_s": round(calls / elapsed, 2),
+                        "busy": round(delta[-1] / elapsed, 2),
+                        "mean_ms": round(1000 * delta[-1] / calls, 2),
+                        "p50_ms": round(1000 * p50, 2),
+                        "p99_ms": round(1000 * p99, 2),
+                        "errors": errors.get(key, 0) - previous_errors.get(key, 0),
+                    }
+                report[metric.name] = section
+            elif isinstance(metric, Gauge):
+                report[metric.name] = current[metric.name]
+            elif not any(getattr(m, "errors", None) is metric for m in self.metrics):
+                before = self._previous.get(metric.name, {})
+                report[metric.name] = {key: value - before.get(key, 0) for key, value in current[metric.name].items()}
+
+        self._previous, self._previous_at = current, now
+        return report
+
+
+# =============================================================================
+# REPORTER
+# =============================================================================
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsReporter:
+    """
+    Background reporting for a Metrics registry, as a context manager.
+
+    Every `interval` seconds: log() a JSON summary and rewrite `path`. With
+    `port`, serves /metrics on `host` (local only by default; port 0 picks a
+    free one). On exit, a final summary and file dump cover the tail of the run.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        interval: float = 10.0,
+        port: Optional[int] = None,
+        path: Optional[str] = None,
+        host: str = "127.0.0.1",
+        log: Callable[[str], None] = print
+    ):
+        self.metrics = metrics
+        self.interval = interval
+        self.port = port
+        self.path = path
+        self.host = host
+        self.log = log
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def __enter__(self):
+        if self.port is not None:
+            self.server = ThreadingHTTPServer((self.host, self.port), _Handler)
+            self.server.daemon_threads = True
+            self.server.metrics = self.metrics
+            self.port = self.server.server_address[1]
+            self.log(f"Metrics: http://{self.host}:{self.port}/metrics")
+            self._threads.append(threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True))
+        if self.interval:
+            self._threads.append(threading.Thread(target=self._loop, name="metrics-report", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self.report()
+
+    def report(self):
+        self.log(json.dumps(self.metrics.summary()))
+        if self.path:
+            try:
+                self.metrics.write(self.path)
+            except OSError as e:
+                self.log(f"Metrics file error ({self.path}): {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.report()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+STREAMS OF COLOR - Painting Palette Index
+==========================================
+Matches faces to paintings by color, in CIELAB.
+
+Every painting palette from fetch_paintings.py (`colors`, "#rrggbb") is held
+in one N x K x 3 Lab array. A face is scored against every painting with a
+few matrix products: for each face color (skin, hair, eyes) the distance is
+the CIE76 delta E to the closest palette color, weighted by role. A query
+over 20k paintings takes about a millisecond, and the bulk mode scores all
+30 subtypes in one pass.
+
+Usage:
+    python palette_index.py --paintings ./paintings/all_paintings.jsonl --face photo.jpg -k 10
+    python palette_index.py --paintings ./paintings/all_paintings.jsonl --skin "#e0b49a" --hair "#3b2418"
+    python palette_index.py --paintings ./paintings/all_paintings.jsonl --suggest-all -k 20 --output links.json
+"""
+
+import json
+import time
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from color_utils import ColorExtractor, SubtypePredictor, batch_rgb_to_lab, hex_to_rgb, rgb_to_hex
+
+# =============================================================================
+# FACE COLORS
+# =============================================================================
+
+ROLES = ["skin", "hair", "eye"]
+ROLE_WEIGHTS = {"skin": 0.5, "hair": 0.3, "eye": 0.2}
+
+# Bin midpoints of ColorExtractor's thresholds, for synthesizing subtype prototypes
+DEPTH_LUMINANCE = {"light": 0.82, "light-medium": 0.69, "medium": 0.55, "medium-deep": 0.40, "deep": 0.22}
+UNDERTONE_WARMTH = {"warm": 0.16, "warm-neutral": 0.085, "neutral": 0.015, "cool-neutral": -0.035, "cool": -0.08}
+CONTRAST_VALUE = {"low": 0.06, "low-medium": 0.18, "medium": 0.31, "medium-high": 0.44, "high": 0.6}
+
+
+def face_colors(face: Dict) -> Dict[str, str]:
+    """
+    Role -> hex from ColorExtractor.extract_all output, a color_labels row
+    (skin_hex / hair_hex / eye_hex) or a plain {"skin": "#..", ...} dict.
+    """
+    colors = {}
+    for role in ROLES:
+        value = face.get(role) or face.get(f"{role}_hex")
+        if isinstance(value, dict):
+            value = value.get("hex")
+        if value:
+            colors[role] = value
+    return colors
+
+
+def _rgb_for(luminance: float, warmth: float, green_share: float = 0.5) -> Tuple[int, int, int]:
+    """An RGB with the given calculate_luminance and calculate_warmth; g sits between b and r."""
+    d = warmth * 255
+    b = luminance * 255 - (0.299 + 0.587 * green_share) * d
+    rgb = np.clip(np.round([b + d, b + green_share * d, b]), 0, 255).astype(int)
+    return tuple(int(v) for v in rgb)
+
+
+def subtype_prototypes(subtypes: Dict[str, Dict] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Skin and hair colors typical of each subtype, synthesized from its
+    undertone, depth and contrast. Hair is darker than skin by the contrast
+    value (lighter when that would go below black).
+    """
+    subtypes = subtypes or SubtypePredictor.SUBTYPES
+    prototypes = {}
+    for code, spec in subtypes.items():
+        skin_lum = DEPTH_LUMINANCE[spec["depth"]]
+        warmth = UNDERTONE_WARMTH[spec["undertone"]]
+        contrast = CONTRAST_VALUE[spec["contrast"]]
+        hair_lum = skin_lum - contrast if skin_lum - contrast >= 0.05 else skin_lum + contrast
+        prototypes[code] = {
+            "skin": rgb_to_hex(_rgb_for(skin_lum, warmth)),
+            "hair": rgb_to_hex(_rgb_for(hair_lum, warmth / 2)),
+        }
+    return prototypes
+
+
+def prototypes_from_labels(rows: List[Dict], subtype_key: str = "confirmed_subtype") -> Dict[str, Dict[str, str]]:
+    """Mean Lab face colors per subtype from labeled color_labels rows, as hex."""
+    groups: Dict[str, Dict[str, List]] = {}
+    for row in rows:
+        code = row.get(subtype_key)
+        if not code:
+            continue
+        for role, value in face_colors(row).items():
+            groups.setdefault(code, {}).setdefault(role, []).append(hex_to_rgb(value))
+
+    prototypes = {}
+    for code, roles in groups.items():
+        # The sample closest to the Lab mean, so the prototype is a real observed color
+        prototypes[code] = {}
+        for role, values in roles.items():
+            rgb = np.array(values)
+            lab = batch_rgb_to_lab(rgb)
+            nearest = np.argmin(((lab - lab.mean(axis=0)) ** 2).sum(axis=1))
+            prototypes[code][role] = rgb_to_hex(tuple(int(v) for v in rgb[nearest]))
+    return prototypes
+
+
+# =============================================================================
+# INDEX
+# =============================================================================
+
+class PaletteIndex:
+    """Brute-force nearest neighbours over painting palettes in CIELAB."""
+
+    def __init__(self, paintings: List[Dict], max_colors: int = 5):
+        self.paintings = [p for p in paintings if p.get("colors")]
+        n, k = len(self.paintings), max_colors
+
+        # Short palettes are padded with their first color, which leaves every minimum unchanged
+        rgb = np.zeros((n, k, 3), dtype=np.float64)
+        for i, painting in enumerate(self.paintings):
+            colors = [hex_to_rgb(c) for c in painting["colors"][:k]]
+            rgb[i] = colors + colors[:1] * (k - len(colors))
+
+        # Palette slot k of every painting as a (5, N) matrix of [L, a, b, |lab|^2, 1], so one
+        # product with a query row [-2L, -2a, -2b, 1, |q|^2] gives squared distances
+        lab = batch_rgb_to_lab(rgb).astype(np.float32)
+        self.slots = np.stack([
+            np.concatenate([lab[:, j], (lab[:, j] ** 2).sum(axis=1, keepdims=True), np.ones((n, 1), np.float32)],
+                           axis=1).T
+            for j in range(k)
+        ]) if n else np.zeros((k, 5, 0), dtype=np.float32)
+        self.shape = (n, k)
+
+    @classmethod
+    def load(cls, path: str, max_colors: int = 5) -> "PaletteIndex":
+        """From fetch_paintings.py output: all_paintings.jsonl or all_paintings.json."""
+        with open(path) as f:
+            if path.endswith(".jsonl"):
+                # An append-only log: the last line for an ID is its current version
+                latest = {}
+                for line in f:
+                    if line.strip():
+                        painting = json.loads(line)
+                        latest[painting["id"]] = painting
+                paintings = list(latest.values())
+            else:
+                paintings = json.load(f)
+        return cls(paintings, max_colors)
+
+    def __len__(self) -> int:
+        return len(self.paintings)
+
+    def distances(self, faces: List[Dict], chunk: int = 4_000_000) -> np.ndarray:
+        """M x N weighted delta E between each face and each painting."""
+        # One query row per (face, role) actually given
+        rgb, owners, weights = [], [], []
+        for i, face in enumerate(faces):
+            colors = face_colors(face)
+            total = sum(ROLE_WEIGHTS[role] for role in colors)
+            for role, value in colors.items():
+                rgb.append(hex_to_rgb(value))
+                owners.append(i)
+                weights.append(ROLE_WEIGHTS[role] / total)
+        n = self.shape[0]
+        if not rgb:
+            return np.zeros((len(faces), n))
+        query = batch_rgb_to_lab(np.array(rgb)).astype(np.float32)
+        query = np.concatenate([-2 * query, np.ones((len(query), 1), np.float32),
+                                (query ** 2).sum(axis=1, keepdims=True)], axis=1)
+
+        # Rows per block so each product stays around `chunk` entries
+        step = max(1, chunk // max(1, n))
+        nearest = np.empty((len(query), n), dtype=np.float32)
+        for start in range(0, len(query), step):
+            block = query[start:start + step]
+            # Closest palette color: a running minimum over slots (a size-K axis reduction is far slower)
+            out = nearest[start:start + step]
+            np.matmul(block, self.slots[0], out=out)
+            for slot in self.slots[1:]:
+                np.minimum(out, block @ slot, out=out)
+        np.sqrt(np.maximum(nearest, 0, out=nearest), out=nearest)
+
+        # Weighted sum of each face's rows
+        combine = np.zeros((len(faces), len(query)), dtype=np.float32)
+        combine[owners, np.arange(len(query))] = weights
+        return (combine @ nearest).astype(np.float64)
+
+    def query_batch(self, faces: List[Dict], k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and distances of the k closest paintings per face, closest first."""
+        dist = self.distances(faces)
+        k = min(k, dist.shape[1])
+        if k == 0:
+            return np.zeros((len(faces), 0), dtype=int), np.zeros((len(faces), 0))
+
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        top_dist = np.take_along_axis(dist, top, axis=1)
+        order = np.argsort(top_dist, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_dist, order, axis=1)
+
+    def query(self, face: Dict, k: int = 10) -> List[Dict]:
+        """The k paintings closest to one face's colors."""
+        indices, dist = self.query_batch([face], k)
+        return [self._result(i, d) for i, d in zip(indices[0], dist[0])]
+
+    def suggest_subtypes(self, k: int = 20, prototypes: Dict[str, Dict[str, str]] = None) -> Dict[str, List[Dict]]:
+        """Top-k paintings for every subtype at once (see subtype_prototypes)."""
+        prototypes = prototypes or subtype_prototypes()
+        codes = list(prototypes)
+        indices, dist = self.query_batch([prototypes[c] for c in codes], k)
+        return {
+            code: [self._result(i, d) for i, d in zip(indices[row], dist[row])]
+            for row, code in enumerate(codes)
+        }
+
+    def _result(self, index: int, distance: float) -> Dict:
+        painting = self.paintings[index]
+        return {
+            "id": painting["id"],
+            "title": painting.get("title"),
+            "artist": painting.get("artist"),
+            "source": painting.get("source"),
+            "colors": painting["colors"],
+            "distance": round(float(distance), 2),
+        }
+
+
+def subtype_links(suggestions: Dict[str, List[Dict]]) -> List[Dict]:
+    """Rows shaped like painting_subtype_links (painting_id is the museum id until imported)."""
+    return [
+        {
+            "painting_id": match["id"],
+            "subtype_code": code,
+            "link_reason": f"palette match (delta E {match['distance']})",
+            "display_order": rank,
+            "is_primary": rank == 0,
+            "created_by": "palette_index",
+        }
+        for code, matches in suggestions.items()
+        for rank, match in enumerate(matches)
+    ]
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Match faces to paintings by palette")
+    parser.add_argument("--paintings", required=True, help="all_paintings.jsonl / .json from fetch_paintings.py")
+    parser.add_argument("--face", help="Face image to match")
+    parser.add_argument("--skin", help="Skin color (#rrggbb)")
+    parser.add_argument("--hair", help="Hair color (#rrggbb)")
+    parser.add_argument("--eye", help="Eye color (#rrggbb)")
+    parser.add_argument("--suggest-all", action="store_true", help="Suggestions for all 30 subtypes")
+    parser.add_argument("-k", type=int, default=10, help="Paintings per query")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = PaletteIndex.load(args.paintings)
+    print(f"Indexed {len(index)} palettes in {time.perf_counter() - start:.2f}s")
+
+    if args.suggest_all:
+        start = time.perf_counter()
+        suggestions = index.suggest_subtypes(args.k)
+        print(f"Scored {len(suggestions)} subtypes in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for code, matches in suggestions.items():
+            best = matches[0] if matches else None
+            print(f"  {code}: {best['title'] if best else '-'} ({best['distance'] if best else '-'})")
+        result = subtype_links(suggestions)
+    else:
+        if args.face:
+            face = ColorExtractor(use_mediapipe=False).extract_all(Image.open(args.face))
+        else:
+            face = {"skin": args.skin, "hair": args.hair, "eye": args.eye}
+        if not face_colors(face):
+            parser.error("Give --face, or at least one of --skin / --hair / --eye")
+
+        start = time.perf_counter()
+        result = index.query(face, args.k)
+        print(f"Query: {(time.perf_counter() - start) * 1000:.1f} ms")
+        for match in result:
+            print(f"  {match['distance']:6.2f}  {match['artist']} - {match['title']} ({match['source']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
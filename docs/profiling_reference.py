@@ -0,0 +1,200 @@
+"""
+STREAMS OF COLOR - Run Profiling
+=================================
+Opt-in profiling for ingest.py and fetch_paintings.py (--profile PREFIX).
+
+Writes, next to PREFIX:
+- PREFIX.pstats     cProfile of every thread, merged (snakeviz, `python -m pstats`)
+- PREFIX.collapsed  wall-clock stack samples of every thread, one "a;b;c count"
+                    line per stack: the format py-spy (`-f raw`) and
+                    flamegraph.pl / speedscope / inferno use
+- PREFIX.alloc.txt  with memory=True: tracemalloc's top allocation sites,
+                    net bytes retained per image (or per item of the run)
+
+Sampling costs about a stack walk per thread every `interval` seconds, so
+its timings stay close to an unprofiled run; cProfile is exact on call
+counts but slows Python-heavy code down. mode picks either or both. For
+native frames (numpy, PIL, libjpeg) run py-spy on the process instead:
+    py-spy record -f raw -o ingest.collapsed -- python ingest.py ...
+
+Usage:
+    with Profiler("profiles/ingest", memory=True) as profiler:
+        profiler.items = Ingestion(db, config).run()
+"""
+
+import os
+import re
+import sys
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+# Leaf frames of a thread that is blocked waiting for work, not doing any
+_IDLE = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+
+# =============================================================================
+# STACK SAMPLER
+# =============================================================================
+
+class StackSampler:
+    """
+    Samples every thread's Python stack on a background thread.
+
+    Pool threads are merged by name ("upload-3" -> "upload"), so each pool
+    is one tower in the flamegraph. Threads blocked in queue/lock waits are
+    skipped unless idle=True, as py-spy does.
+    """
+
+    def __init__(self, interval: float = 0.005, idle: bool = False):
+        self.interval = interval
+        self.idle = idle
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._names: Dict = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            threads = {t.ident: re.sub(r"[-_]\d+$", "", t.name) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if not self.idle and self._frame(stack[0])[1] in _IDLE:
+                    continue
+                self.counts[(threads.get(ident, "thread"), tuple(stack))] += 1
+            self.samples += 1
+
+    def _frame(self, code) -> Tuple[str, Tuple[str, str]]:
+        """'name (file.py:line)' label and (file, name) key for a code object, cached."""
+        cached = self._names.get(code)
+        if cached is None:
+            filename = os.path.basename(code.co_filename)
+            cached = self._names[code] = (f"{code.co_name} ({filename}:{code.co_firstlineno})", (filename, code.co_name))
+        return cached
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for (thread, stack), count in self.counts.most_common():
+                frames = ";".join(self._frame(code)[0] for code in reversed(stack))
+                f.write(f"{thread};{frames} {count}\n")
+
+
+# =============================================================================
+# PROFILER
+# =============================================================================
+
+class Profiler:
+    """
+    Context manager profiling everything inside it; a no-op when prefix is None.
+
+    Set `items` (images ingested, paintings fetched) before exit to get
+    allocations per item; otherwise they are reported for the whole run.
+    """
+
+    MODES = ("both", "cprofile", "sample")
+
+    def __init__(
+        self,
+        prefix: Optional[str] = None,
+        mode: str = "both",
+        interval: float = 0.005,
+        memory: bool = False,
+        top: int = 25
+    ):
+        self.prefix = prefix
+        self.mode = mode
+        self.interval = interval
+        self.memory = memory
+        self.top = top
+        self.items = 0
+        self.sampler: Optional[StackSampler] = None
+        self.profile: Optional[cProfile.Profile] = None
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def __enter__(self):
+        if self.prefix is None:
+            return self
+        os.makedirs(os.path.dirname(self.prefix) or ".", exist_ok=True)
+        if self.memory:
+            tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.mode in ("both", "sample"):
+            self.sampler = StackSampler(self.interval)
+            self.sampler.start()
+        if self.mode in ("both", "cprofile"):
+            # Before 3.12 a cProfile only sees the thread that enabled it: give each new thread its own
+            if sys.version_info < (3, 12):
+                threading.setprofile(self._profile_thread)
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.prefix is None:
+            return
+        if self.profile is not None:
+            self.profile.disable()
+            threading.setprofile(None)
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.memory:
+            self._write_allocations()
+        if self.sampler is not None:
+            self.sampler.write(f"{self.prefix}.collapsed")
+            print(f"Profile: {self.prefix}.collapsed ({self.sampler.samples} samples)")
+        if self.profile is not None:
+            stats = pstats.Stats(self.profile)
+            with self._lock:
+                for profile in self._thread_profiles:
+                    stats.add(profile)
+            stats.dump_stats(f"{self.prefix}.pstats")
+            print(f"Profile: {self.prefix}.pstats ({len(self._thread_profiles)} threads besides main), top by own time:")
+            stats.sort_stats("tottime").print_stats(10)
+
+    def _profile_thread(self, *args):
+        """threading.setprofile hook: runs once per new thread, then cProfile replaces it."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _write_allocations(self):
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        growth = snapshot.filter_traces(filters).compare_to(self._snapshot.filter_traces(filters), "lineno")
+        per = max(self.items, 1)
+        unit = "item" if self.items else "run"
+        path = f"{self.prefix}.alloc.txt"
+        with open(path, "w") as f:
+            f.write(f"# {self.items or 'unknown'} items, peak traced {peak / 2 ** 20:.1f} MB\n")
+            f.write(f"# net retained per {unit}: KB, blocks, site\n")
+            for stat in growth[:self.top]:
+                f.write(f"{stat.size_diff / 1024 / per:10.2f} {stat.count_diff / per:10.1f}  {stat.traceback}\n")
+        print(f"Profile: {path} (peak traced {peak / 2 ** 20:.1f} MB)")
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+STREAMS OF COLOR - Parallel Re-labeling
+========================================
+Color analysis + subtype prediction on every core, outside ingestion.
+
+Images are decoded in the parent (I/O threads), packed into shared-memory
+blocks and analyzed by a process pool: workers map the block instead of
+unpickling images, and send back only the small label dicts. Results come
+back in input order, so they are written to color_labels in bulk.
+
+Only rows whose label_status is unlabeled, ai_predicted or needs_review are
+touched; human labels are left alone.
+
+--names instead fills eye_color_name / hair_color_name from the stored
+eye_hex / hair_hex through the color-name lookup tables: no images, one
+table gather per page of rows.
+
+Usage:
+    python relabel.py                                  # every AI/unlabeled row, all cores
+    python relabel.py --threshold 0.6 --thumbnails     # after changing the confidence threshold
+    python relabel.py --workers 8 --analysis-size 128 --color-estimator histogram
+    python relabel.py --names                          # tag color names on every row missing one
+
+Library:
+    with Relabeler(config) as relabeler:
+        for key, label in relabeler.label((key, image) for ...):
+            ...
+"""
+
+import io
+import os
+import re
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Iterable, Iterator, Tuple
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+from dotenv import load_dotenv
+
+from color_utils import downscale, DominantColorEstimator, EYE_COLOR_LUT, HAIR_COLOR_LUT
+from ingest import Config, Database, ColorAnalyzer, Predictor, label_records
+
+load_dotenv()
+
+RELABEL_STATUSES = ["unlabeled", "ai_predicted", "needs_review"]
+
+_HEX = re.compile(r"#?[0-9a-fA-F]{6}")
+
+# color_labels name column <- (hex column, lookup table)
+COLOR_NAME_COLUMNS = {
+    "eye_color_name": ("eye_hex", EYE_COLOR_LUT),
+    "hair_color_name": ("hair_hex", HAIR_COLOR_LUT),
+}
+
+
+# =============================================================================
+# WORKERS
+# =============================================================================
+
+_worker: Dict = {}
+
+
+def _init_worker(use_landmarks: bool, estimator: str, threshold: float):
+    """Per-process analyzer and predictor (and FaceMesh), built once."""
+    _worker["analyzer"] = ColorAnalyzer(use_landmarks=use_landmarks, estimator=estimator)
+    _worker["predictor"] = Predictor()
+    _worker["threshold"] = threshold
+
+
+def _label_block(name: str, shape: Tuple[int, ...]) -> List[Dict]:
+    """Labels for an N x H x W x 3 uint8 block in shared memory."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        stack = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        features = _worker["analyzer"].extract_batch(stack)
+        del stack  # the buffer can't be closed while a view is alive
+        return label_records(features, _worker["predictor"], _worker["threshold"])
+    finally:
+        block.close()
+
+
+# =============================================================================
+# RELABELER
+# =============================================================================
+
+class Relabeler:
+    """
+    Order-preserving labeler over a process pool.
+
+    Consecutive same-size images are packed into one shared-memory block
+    (up to `chunk_size`); at most `max_in_flight` blocks are outstanding,
+    which bounds memory however long the input is.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        workers: Optional[int] = None,
+        chunk_size: int = 64,
+        max_in_flight: Optional[int] = None
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(config.landmarks, config.color_estimator, config.auto_label_threshold),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def label(self, items: Iterable[Tuple[object, Image.Image]]) -> Iterator[Tuple[object, Dict]]:
+        """(key, label) for every (key, image), in input order; label is None where its block failed."""
+        pending = deque()
+        try:
+            for keys, images in self._runs(items):
+                pending.append((keys, *self._submit(images)))
+                while len(pending) > self.max_in_flight:
+                    yield from self._collect(*pending.popleft())
+            while pending:
+                yield from self._collect(*pending.popleft())
+        finally:
+            # Generator closed early: let started blocks finish (workers hold them open), then free all
+            for _, future, block in pending:
+                if not future.cancel():
+                    wait([future])
+                block.unlink()
+                block.close()
+
+    def _runs(self, items: Iterable[Tuple[object, Image.Image]]) -> Iterator[Tuple[List, List[Image.Image]]]:
+        """Consecutive same-size images, at most chunk_size at a time."""
+        keys, images = [], []
+        for key, image in items:
+            if images and (image.size != images[0].size or len(images) >= self.chunk_size):
+                yield keys, images
+                keys, images = [], []
+            keys.append(key)
+            images.append(image)
+        if images:
+            yield keys, images
+
+    def _submit(self, images: List[Image.Image]):
+        w, h = images[0].size
+        shape = (len(images), h, w, 3)
+        block = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        stack = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        for i, image in enumerate(images):
+            stack[i] = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        del stack
+        return self.pool.submit(_label_block, block.name, shape), block
+
+    def _collect(self, keys: List, future, block) -> Iterator[Tuple[object, Optional[Dict]]]:
+        try:
+            labels = future.result()
+        except BrokenProcessPool:
+            raise  # A worker died: every later block would fail too
+        except Exception as e:
+            print(f"Relabel error: {e}")
+            labels = [None] * len(keys)
+        finally:
+            block.unlink()
+            block.close()
+        yield from zip(keys, labels)
+
+
+# =============================================================================
+# TABLE
+# =============================================================================
+
+def _prefetch(fn, items: Iterable, pool: ThreadPoolExecutor, depth: int) -> Iterator:
+    """pool.map(fn, items) with at most `depth` calls ahead of the consumer."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def relabel_table(
+    db: Database,
+    config: Config,
+    workers: Optional[int] = None,
+    statuses: List[str] = RELABEL_STATUSES,
+    thumbnails: bool = False,
+    download_workers: int = 16,
+    limit: Optional[int] = None
+) -> int:
+    """
+    Re-analyze every face_images row whose label has one of `statuses` and
+    overwrite its AI fields, config.batch_size rows per request. Rows whose
+    analysis failed, or that a reviewer labeled during the run, are left as
+    they were.
+    """
+    def fetch(row: Dict) -> Tuple[str, Optional[Image.Image]]:
+        path = row["thumbnail_path"] if thumbnails and row.get("thumbnail_path") else row["storage_path"]
+        try:
+            image = Image.open(io.BytesIO(db.download_bytes(path)))
+            if config.analysis_size:
+                image = downscale(image, config.analysis_size)
+            return row["id"], image.convert("RGB")
+        except Exception as e:
+            print(f"Download error ({path}): {e}")
+            return row["id"], None
+
+    def write(batch: List[Dict]):
+        nonlocal written, changed
+        stored = len(db.update_labels_if(batch, statuses))
+        written += stored
+        changed += len(batch) - stored
+
+    rows = db.iter_label_rows(statuses)
+    if limit:
+        rows = itertools.islice(rows, limit)
+
+    written = failed = changed = 0
+    batch: List[Dict] = []
+    pbar = tqdm(desc="Relabeling", unit="images")
+    with ThreadPoolExecutor(download_workers, thread_name_prefix="download") as io_pool, \
+            Relabeler(config, workers) as relabeler:
+        fetched = _prefetch(fetch, rows, io_pool, depth=4 * download_workers)
+        images = ((face_id, image) for face_id, image in fetched if image is not None)
+
+        for face_id, label in relabeler.label(images):
+            pbar.update(1)
+            if label is None:
+                failed += 1
+                continue
+            batch.append({"face_image_id": face_id, **label})
+            if len(batch) >= config.batch_size:
+                write(batch)
+                batch = []
+        if batch:
+            write(batch)
+    pbar.close()
+    if failed:
+        print(f"Skipped {failed} images whose analysis failed (left unchanged)")
+    if changed:
+        print(f"Skipped {changed} images labeled during the run (left unchanged)")
+    return written
+
+
+def tag_color_names(db: Database, page_size: int = 1000, overwrite: bool = False) -> int:
+    """
+    Set eye_color_name / hair_color_name from each row's stored hex color.
+
+    Names already set (e.g. by a reviewer) are kept unless `overwrite`.
+    Writes go through upsert_labels, not update_labels: a derived name
+    doesn't change labeled_at. Returns the number of names written.
+    """
+    written = 0
+    rows = iter(db.iter_color_hexes(missing_only=not overwrite, page_size=page_size))
+    pbar = tqdm(desc="Tagging color names", unit="rows")
+    while True:
+        page = list(itertools.islice(rows, page_size))
+        if not page:
+            break
+        for column, (hex_column, lut) in COLOR_NAME_COLUMNS.items():
+            todo = [
+                row for row in page
+                if _HEX.fullmatch(row.get(hex_column) or "") and (overwrite or not row.get(column))
+            ]
+            if todo:
+                names = lut([row[hex_column] for row in todo]).tolist()
+                db.upsert_labels([{"face_image_id": row["face_image_id"], column: name} for row, name in zip(todo, names)])
+                written += len(todo)
+        pbar.update(len(page))
+    pbar.close()
+    return written
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Streams of Color - re-label faces on every core")
+    parser.add_argument("--workers", type=int, help="Analysis processes (default: all cores)")
+    parser.add_argument("--threshold", type=float, default=0.7,
+                        help="ai_confidence at or above which a label is ai_predicted, else needs_review")
+    parser.add_argument("--status", nargs="+", default=RELABEL_STATUSES, choices=RELABEL_STATUSES,
+                        help="Label statuses to redo")
+    parser.add_argument("--thumbnails", action="store_true", help="Analyze the stored thumbnails (much less I/O)")
+    parser.add_argument("--analysis-size", type=int, help="Downscale to this longest side before analysis")
+    parser.add_argument("--color-estimator", choices=DominantColorEstimator.METHODS, default="mean")
+    parser.add_argument("--no-landmarks", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per color_labels write")
+    parser.add_argument("--download-workers", type=int, default=16)
+    parser.add_argument("--limit", type=int, help="Stop after this many rows")
+    parser.add_argument("--bucket", default="face-images")
+    parser.add_argument("--names", action="store_true",
+                        help="Only fill eye/hair color names from the stored hex colors (no images)")
+    parser.add_argument("--overwrite-names", action="store_true", help="With --names, recompute names already set")
+    args = parser.parse_args()
+
+    config = Config(
+        supabase_url=os.getenv("SUPABASE_URL"),
+        supabase_key=os.getenv("SUPABASE_KEY"),
+        storage_bucket=args.bucket,
+        batch_size=args.batch_size,
+        auto_label_threshold=args.threshold,
+        landmarks=not args.no_landmarks,
+        color_estimator=args.color_estimator,
+        analysis_size=args.analysis_size
+    )
+    if args.names:
+        written = tag_color_names(Database(config), args.batch_size, args.overwrite_names)
+        print(f"\nDone! Wrote {written} color names.")
+        return
+
+    written = relabel_table(
+        Database(config), config, args.workers, args.status,
+        thumbnails=args.thumbnails, download_workers=args.download_workers, limit=args.limit
+    )
+    print(f"\nDone! Relabeled {written} images.")
+
+
+if __name__ == "__main__":
+    main()
@@ -281,6 +281,17 @@ CREATE TABLE vocabulary_terms (
 -- ============================================================
 
 CREATE INDEX idx_face_images_source ON face_images(source);
+-- One row per dataset sample; lets ingest.py upsert on (source, source_id) when resuming
+--
+-- Migrating an existing database: earlier runs could insert the same sample
+-- twice, and this index fails to build while duplicates exist. Check first:
+--   SELECT source, source_id, count(*) FROM face_images
+--   WHERE source_id IS NOT NULL GROUP BY 1, 2 HAVING count(*) > 1;
+-- then keep the oldest row of each (its color_labels follow via ON DELETE CASCADE):
+--   DELETE FROM face_images f USING face_images g
+--   WHERE f.source = g.source AND f.source_id = g.source_id
+--     AND (f.created_at, f.id) > (g.created_at, g.id);
+CREATE UNIQUE INDEX idx_face_images_source_id ON face_images(source, source_id);
 CREATE INDEX idx_face_images_quality ON face_images(quality_score) WHERE quality_score IS NOT NULL;
 CREATE INDEX idx_face_images_unprocessed ON face_images(id) WHERE NOT is_processed;
 